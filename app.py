@@ -1,15 +1,26 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, send_file
+from flask import (
+    Flask, render_template, request, jsonify, redirect, url_for, session, send_file,
+    Response, stream_with_context
+)
 from database import (
-    init_db, get_all_channels, get_channel_count, update_emailed_status, 
+    init_db, db_initialized, update_emailed_status, 
     update_channel_notes, get_fetched_channel_ids, get_user_by_username,
     verify_password, create_user, get_all_users, delete_user, get_user_by_id,
     get_user_stats, update_user_password, log_activity, get_activity_log,
-    get_analytics_data, update_channel_priority_scores, update_reply_status
+    get_analytics_data, update_reply_status, encode_channel_cursor, decode_channel_cursor,
+    VALID_SORT_FIELDS, get_channel_stats, get_channel_page, iter_channels,
+    get_job, get_jobs, request_job_cancel, get_data_versions
 )
-import pandas as pd
+from openpyxl import Workbook
+import csv
 import io
-from youtube_fetcher import fetch_new_channels, analyze_channel
+import tempfile
+from youtube_fetcher import (
+    analyze_channel, analyze_channels, get_quota_status, get_cache_stats, QuotaExceededError
+)
+from jobs import queue_fetch_job, start_job_runner
 from functools import wraps
+import hashlib
 import os
 
 app = Flask(__name__)
@@ -31,16 +42,37 @@ if os.environ.get('FLASK_ENV') == 'production' or not os.environ.get('FLASK_DEBU
     app.config['DEBUG'] = False
     app.config['TESTING'] = False
 
-# Initialize database on startup
-init_db()
+# Initialize database on startup - under gunicorn the master already did it
+# once before forking the workers (see on_starting in gunicorn.conf.py)
+if not db_initialized():
+    init_db()
+
+# Run queued background jobs (channel sweeps) in this process
+start_job_runner()
 
 # ==================== AUTHENTICATION HELPERS ====================
 
+def current_user():
+    """
+    Get the logged-in user (from the user cache), or None
+    Clears the session if the user has been deleted (deactivated)
+    """
+    if 'user_id' not in session:
+        return None
+    user = get_user_by_id(session['user_id'])
+    if not user:
+        session.clear()
+        return None
+    # Keep the signed session's role in step with the database
+    if session.get('role') != user['role']:
+        session['role'] = user['role']
+    return user
+
 def login_required(f):
     """Decorator to require login"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        if not current_user():
             return jsonify({'error': 'Authentication required'}), 401
         return f(*args, **kwargs)
     return decorated_function
@@ -51,12 +83,53 @@ def admin_required(f):
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
             return jsonify({'error': 'Authentication required'}), 401
-        user = get_user_by_id(session['user_id'])
-        if not user or user.get('role') != 'admin':
+        # The signed session's role turns non-admins away without a lookup;
+        # admins are re-checked against the (cached) user in case of demotion
+        if session.get('role') != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        user = current_user()
+        if not user:
+            return jsonify({'error': 'Authentication required'}), 401
+        if user['role'] != 'admin':
             return jsonify({'error': 'Admin access required'}), 403
         return f(*args, **kwargs)
     return decorated_function
 
+# Bump to invalidate every ETag, e.g. when a response format changes
+ETAG_VERSION = os.environ.get('ETAG_VERSION', '1')
+
+def conditional_get(*scopes):
+    """
+    Decorator adding ETag / If-None-Match support to a JSON GET endpoint
+    The ETag is built from the data_versions of `scopes` (bumped on every write),
+    the user, their role and the full query string, so a matching
+    If-None-Match gets a 304 without running the endpoint's queries.
+    Use below login_required / admin_required.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            versions = get_data_versions(scopes)
+            key = '|'.join([
+                ETAG_VERSION, request.endpoint, request.query_string.decode(),
+                str(session.get('user_id')), str(session.get('role')),
+                *(f'{scope}={versions[scope]}' for scope in scopes)
+            ])
+            etag = hashlib.sha1(key.encode()).hexdigest()
+            
+            if request.if_none_match.contains(etag):
+                response = app.response_class(status=304)
+            else:
+                response = app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            # Browsers may keep the response but must revalidate it every time
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
+
 # ==================== AUTHENTICATION ROUTES ====================
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -97,7 +170,7 @@ def logout():
 @login_required
 def get_current_user():
     """Get current logged in user info"""
-    user = get_user_by_id(session['user_id'])
+    user = current_user()
     if user:
         stats = get_user_stats(user['id'])
         return jsonify({
@@ -192,26 +265,66 @@ def analyze_channel_api():
         response.headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
         response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
         return response
+    except QuotaExceededError:
+        response = jsonify({
+            'success': False, 
+            'error': 'API quota exceeded. Please try again later.'
+        })
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        return response, 503
     except Exception as e:
         error_msg = str(e)
-        # Check for quota errors
-        if 'quota' in error_msg.lower() or 'quotaExceeded' in error_msg:
-            response = jsonify({
-                'success': False, 
-                'error': 'API quota exceeded. Please try again later.'
-            })
-            response.headers['Access-Control-Allow-Origin'] = '*'
-            return response, 503
         response = jsonify({'success': False, 'error': f'Error analyzing channel: {error_msg}'})
         response.headers['Access-Control-Allow-Origin'] = '*'
         return response, 500
 
+# Most channel URLs accepted by one /api/analyze/batch request
+MAX_BATCH_ANALYZE = 500
+
+@app.route('/api/analyze/batch', methods=['OPTIONS'])
+def analyze_batch_api_options():
+    """Handle CORS preflight requests"""
+    response = app.make_response('')
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
+    return response
+
+@app.route('/api/analyze/batch', methods=['POST'])
+def analyze_batch_api():
+    """Public API endpoint to analyze many YouTube channels in one request"""
+    data = request.get_json(silent=True)
+    channel_urls = data.get('channel_urls') if isinstance(data, dict) else None
+    
+    if not isinstance(channel_urls, list) or not channel_urls:
+        response = jsonify({'success': False, 'error': 'channel_urls must be a non-empty list of channel URLs'})
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        return response, 400
+    
+    if len(channel_urls) > MAX_BATCH_ANALYZE:
+        response = jsonify({'success': False, 'error': f'At most {MAX_BATCH_ANALYZE} channel URLs per request'})
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        return response, 400
+    
+    results = analyze_channels(channel_urls)
+    succeeded = sum(1 for result in results if result['success'])
+    response = jsonify({
+        'success': True,
+        'results': results,
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded
+    })
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
+    return response
+
 @app.route('/users')
 def users_page():
     """User management page (admin only)"""
     if 'user_id' not in session:
         return redirect(url_for('login'))
-    user = get_user_by_id(session['user_id'])
+    user = current_user()
     if not user or user.get('role') != 'admin':
         return redirect(url_for('dashboard'))
     return render_template('users.html')
@@ -220,6 +333,7 @@ def users_page():
 
 @app.route('/api/channels')
 @login_required
+@conditional_get('channels', 'users')
 def api_channels():
     """API endpoint to get channels with pagination and advanced filters"""
     page = int(request.args.get('page', 1))
@@ -234,6 +348,7 @@ def api_channels():
     reply_filter = request.args.get('reply')
     sort_by = request.args.get('sort_by', 'fetched_at')
     sort_order = request.args.get('sort_order', 'DESC')
+    cursor = request.args.get('cursor')  # keyset pagination token from next_cursor
     
     # Convert emailed filter
     emailed = None
@@ -250,36 +365,40 @@ def api_channels():
         reply = False
     
     offset = (page - 1) * per_page
-    channels = get_all_channels(
-        emailed_filter=emailed, 
-        search_query=search_query, 
-        limit=per_page, 
-        offset=offset,
-        country_filter=country_filter,
-        keyword_filter=keyword_filter,
-        min_subscribers=min_subscribers,
-        max_subscribers=max_subscribers,
-        min_score=min_score,
-        reply_filter=reply,
-        sort_by=sort_by,
-        sort_order=sort_order
-    )
-    total_count = get_channel_count(
-        emailed_filter=emailed,
-        country_filter=country_filter,
-        keyword_filter=keyword_filter,
-        min_subscribers=min_subscribers,
-        max_subscribers=max_subscribers,
-        min_score=min_score,
-        reply_filter=reply
-    )
+    try:
+        if cursor:
+            # A cursor carries the sort it was created for
+            sort_by, sort_order = decode_channel_cursor(cursor)[:2]
+        channels, total_count = get_channel_page(
+            emailed_filter=emailed, 
+            search_query=search_query, 
+            limit=per_page, 
+            offset=offset,
+            country_filter=country_filter,
+            keyword_filter=keyword_filter,
+            min_subscribers=min_subscribers,
+            max_subscribers=max_subscribers,
+            min_score=min_score,
+            reply_filter=reply,
+            sort_by=sort_by,
+            sort_order=sort_order,
+            cursor=cursor
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Cursor for the next page (None on the last page; relevance sort pages by offset)
+    next_cursor = None
+    if len(channels) == per_page and sort_by in VALID_SORT_FIELDS:
+        next_cursor = encode_channel_cursor(channels[-1], sort_by, sort_order)
     
     return jsonify({
         'channels': channels,
         'total': total_count,
         'page': page,
         'per_page': per_page,
-        'total_pages': (total_count + per_page - 1) // per_page
+        'total_pages': (total_count + per_page - 1) // per_page,
+        'next_cursor': next_cursor
     })
 
 @app.route('/api/channels/update-emailed', methods=['POST'])
@@ -330,41 +449,67 @@ def update_reply():
 @app.route('/api/fetch', methods=['POST'])
 @admin_required
 def fetch_channels():
-    """Trigger a new channel fetch (Admin only) - Targets 100 new channels"""
+    """
+    Queue a new channel fetch (Admin only) - Targets 100 new channels
+    The sweep runs in the background; poll /api/jobs/<job_id> for progress
+    """
     data = request.json or {}
     max_results = data.get('max_results', 50)  # Reduced to 50 for quota efficiency
     target_channels = data.get('target_channels', 100)  # Default target: 100 channels
     user_id = session['user_id']
     
-    try:
-        result = fetch_new_channels(max_results=max_results, target_channels=target_channels, user_id=user_id)
-        
-        # Log activity
-        log_activity(user_id, 'fetch_channels', None, None, 
-                    f'Fetched {result["new_channels"]} new channels')
-        
-        # Update priority scores for new channels
-        update_channel_priority_scores()
-        
-        return jsonify({
-            'success': True,
-            'message': f'Successfully fetched {result["new_channels"]} new channels',
-            'total_fetched': result['total_fetched'],
-            'skipped': result['skipped'],
-            'target_reached': result.get('target_reached', False)
-        })
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    job_id = queue_fetch_job(max_results=max_results, target_channels=target_channels, user_id=user_id)
+    log_activity(user_id, 'queue_fetch', 'job', job_id, f'Queued fetch of {target_channels} channels')
+    return jsonify({'success': True, 'job_id': job_id, 'status': 'queued'}), 202
+
+@app.route('/api/jobs')
+@admin_required
+def api_jobs():
+    """List recent background jobs (Admin only)"""
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify({'success': True, 'jobs': get_jobs(limit=min(limit, 100), job_type=request.args.get('type'))})
+
+@app.route('/api/jobs/<int:job_id>')
+@admin_required
+def api_job_status(job_id):
+    """Get a background job's status and progress (Admin only)"""
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+@admin_required
+def api_cancel_job(job_id):
+    """Cancel a queued or running background job (Admin only)"""
+    if not request_job_cancel(job_id):
+        return jsonify({'success': False, 'error': 'Job not found or already finished'}), 404
+    log_activity(session['user_id'], 'cancel_job', 'job', job_id, None)
+    return jsonify({'success': True})
+
+@app.route('/api/quota')
+@admin_required
+def get_quota():
+    """Get today's YouTube API quota usage (Admin only)"""
+    return jsonify({'success': True, 'quota': get_quota_status()})
+
+@app.route('/api/cache/stats')
+@admin_required
+def get_api_cache_stats():
+    """Get YouTube API response cache statistics (Admin only)"""
+    return jsonify({'success': True, 'cache': get_cache_stats()})
 
 @app.route('/api/stats')
 @login_required
+@conditional_get('channels')
 def get_stats():
     """Get dashboard statistics"""
-    total_channels = get_channel_count()
-    emailed_channels = get_channel_count(emailed_filter=True)
-    not_emailed_channels = get_channel_count(emailed_filter=False)
-    replies_received = get_channel_count(reply_filter=True)
-    no_replies = get_channel_count(reply_filter=False)
+    counts = get_channel_stats()
+    total_channels = counts['total']
+    emailed_channels = counts['emailed']
+    not_emailed_channels = counts['not_emailed']
+    replies_received = counts['replied']
+    no_replies = counts['not_replied']
     
     # Get current user stats
     user_stats = get_user_stats(session['user_id'])
@@ -385,6 +530,7 @@ def get_stats():
 
 @app.route('/api/analytics')
 @login_required
+@conditional_get('channels', 'users')
 def get_analytics():
     """Get analytics data"""
     try:
@@ -395,6 +541,7 @@ def get_analytics():
 
 @app.route('/api/filters/options')
 @login_required
+@conditional_get('channels')
 def get_filter_options():
     """Get available filter options (keywords, countries)"""
     from database import get_db
@@ -417,22 +564,65 @@ def get_filter_options():
 
 @app.route('/api/activity')
 @login_required
+@conditional_get('activity', 'users')
 def get_activity():
-    """Get activity log"""
-    limit = int(request.args.get('limit', 100))
+    """
+    Get activity log, newest first
+    Poll with since_id=<last_id> to get only new entries; page back with before_id
+    """
+    limit = min(int(request.args.get('limit', 100)), 1000)
     user_id = request.args.get('user_id', type=int)
     action = request.args.get('action')
+    since_id = request.args.get('since_id', type=int)
+    before_id = request.args.get('before_id', type=int)
     
     # Only admins can see all activity
     if user_id and session.get('role') != 'admin':
         user_id = session['user_id']
     
     try:
-        activities = get_activity_log(limit=limit, user_id=user_id, action=action)
-        return jsonify({'success': True, 'activities': activities})
+        activities = get_activity_log(limit=limit, user_id=user_id, action=action,
+                                      since_id=since_id, before_id=before_id)
+        return jsonify({
+            'success': True,
+            'activities': activities,
+            # Newest id seen - pass back as since_id on the next poll
+            'last_id': activities[0]['id'] if activities else since_id,
+            # More new entries than fit in this response - reload instead of polling
+            'truncated': since_id is not None and len(activities) == limit
+        })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# Export columns, in order
+EXPORT_HEADERS = [
+    'Title', 'Channel URL', 'Country', 'Country Code', 'Subscribers', 'Total Views', 'Video Count',
+    'Search Keyword', 'Priority Score', 'Emailed', 'Emailed By', 'Emailed At', 'Reply Received',
+    'Replied By', 'Replied At', 'Notes', 'Fetched At'
+]
+
+def export_row(ch):
+    """Build the export row (EXPORT_HEADERS order) for a channel"""
+    return [
+        ch.get('title', ''),
+        ch.get('channel_url', ''),
+        ch.get('country', ''),
+        ch.get('country_code', ''),
+        ch.get('subscribers', 0),
+        ch.get('total_views', 0),
+        ch.get('video_count', 0),
+        ch.get('search_keyword', ''),
+        ch.get('priority_score', 0),
+        'Yes' if ch.get('emailed') else 'No',
+        ch.get('emailed_by_username', ''),
+        ch.get('emailed_at', ''),
+        'Yes' if ch.get('reply_received') else 'No',
+        ch.get('replied_by_username', ''),
+        ch.get('replied_at', ''),
+        ch.get('notes', ''),
+        ch.get('fetched_at', '')
+    ]
+
 @app.route('/api/export')
 @login_required
 def export_channels():
@@ -461,12 +651,10 @@ def export_channels():
     elif reply_filter == 'false':
         reply = False
     
-    # Get all matching channels (no pagination for export)
-    channels = get_all_channels(
+    user_id = session['user_id']
+    channels = iter_channels(
         emailed_filter=emailed,
         search_query=search_query,
-        limit=10000,  # Large limit for export
-        offset=0,
         country_filter=country_filter,
         keyword_filter=keyword_filter,
         min_subscribers=min_subscribers,
@@ -474,51 +662,47 @@ def export_channels():
         min_score=min_score,
         reply_filter=reply
     )
+    exported = [0]
     
-    # Prepare data for export
-    export_data = []
-    for ch in channels:
-        export_data.append({
-            'Title': ch.get('title', ''),
-            'Channel URL': ch.get('channel_url', ''),
-            'Country': ch.get('country', ''),
-            'Country Code': ch.get('country_code', ''),
-            'Subscribers': ch.get('subscribers', 0),
-            'Total Views': ch.get('total_views', 0),
-            'Video Count': ch.get('video_count', 0),
-            'Search Keyword': ch.get('search_keyword', ''),
-            'Priority Score': ch.get('priority_score', 0),
-            'Emailed': 'Yes' if ch.get('emailed') else 'No',
-            'Emailed By': ch.get('emailed_by_username', ''),
-            'Emailed At': ch.get('emailed_at', ''),
-            'Reply Received': 'Yes' if ch.get('reply_received') else 'No',
-            'Replied By': ch.get('replied_by_username', ''),
-            'Replied At': ch.get('replied_at', ''),
-            'Notes': ch.get('notes', ''),
-            'Fetched At': ch.get('fetched_at', '')
-        })
+    def export_rows():
+        for ch in channels:
+            exported[0] += 1
+            yield export_row(ch)
     
-    df = pd.DataFrame(export_data)
-    
-    # Log activity
-    log_activity(session['user_id'], 'export_channels', None, None, 
-                f'Exported {len(export_data)} channels as {format_type}')
+    def log_export():
+        log_activity(user_id, 'export_channels', None, None, 
+                    f'Exported {exported[0]} channels as {format_type}')
     
     if format_type == 'csv':
-        output = io.StringIO()
-        df.to_csv(output, index=False)
-        output.seek(0)
-        return send_file(
-            io.BytesIO(output.getvalue().encode()),
+        def generate():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_HEADERS)
+            for row in export_rows():
+                writer.writerow(row)
+                if buffer.tell() >= 64 * 1024:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+            log_export()
+        
+        return Response(
+            stream_with_context(generate()),
             mimetype='text/csv',
-            as_attachment=True,
-            download_name='youtube_channels.csv'
+            headers={'Content-Disposition': 'attachment; filename=youtube_channels.csv'}
         )
     else:  # excel
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Channels')
+        # Write-only workbooks stream rows to disk instead of holding cells in memory
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet('Channels')
+        sheet.append(EXPORT_HEADERS)
+        for row in export_rows():
+            sheet.append(row)
+        output = tempfile.TemporaryFile()
+        workbook.save(output)
         output.seek(0)
+        log_export()
         return send_file(
             output,
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
@@ -564,6 +748,7 @@ def api_create_user():
     
     success, result = create_user(username, email, password, role)
     if success:
+        log_activity(session['user_id'], 'created_user', 'user', result, f'Created {role} {username}')
         return jsonify({'success': True, 'user_id': result})
     return jsonify({'success': False, 'error': result}), 400
 
@@ -576,6 +761,7 @@ def api_delete_user(user_id):
     
     deleted = delete_user(user_id)
     if deleted:
+        log_activity(session['user_id'], 'deleted_user', 'user', user_id, 'User deleted')
         return jsonify({'success': True})
     return jsonify({'success': False, 'error': 'User not found'}), 404
 
@@ -591,6 +777,7 @@ def api_reset_password(user_id):
     
     updated = update_user_password(user_id, new_password)
     if updated:
+        log_activity(session['user_id'], 'reset_password', 'user', user_id, 'Password reset by admin')
         return jsonify({'success': True})
     return jsonify({'success': False, 'error': 'User not found'}), 404
 
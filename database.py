@@ -1,24 +1,98 @@
 import sqlite3
-from datetime import datetime
+import atexit
+from datetime import datetime, timezone
 from contextlib import contextmanager
+from scoring import CURRENT_FORMULA_VERSION, score_frame, score_values
+import pandas as pd
+import threading
 import hashlib
 import secrets
+import base64
+import json
+import time
+import os
+import re
 
 DB_NAME = 'youtube_channels.db'
 
+# Formula version of stored scores (see scoring.SCORING_FORMULAS) - when it
+# changes, stored scores are recomputed once at startup by
+# update_channel_priority_scores()
+SCORE_FORMULA_VERSION = CURRENT_FORMULA_VERSION
+
+# How long a connection waits for another writer before "database is locked"
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 10000))
+
+# Write counters kept in data_versions, bumped by triggers on every write to
+# the table: {scope: table}. Used to invalidate caches and build ETags.
+DATA_VERSION_SCOPES = {
+    'channels': 'channels',
+    'users': 'users',
+    'activity': 'activity_log',
+}
+
+# Applied once to every pooled connection
+DB_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',          # readers don't block the writer (and vice versa)
+    'PRAGMA synchronous=NORMAL',        # safe with WAL, no fsync on every commit
+    f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}',
+    'PRAGMA mmap_size=268435456',       # 256 MB memory-mapped reads
+    'PRAGMA cache_size=-65536',         # 64 MB page cache
+    'PRAGMA temp_store=MEMORY',
+)
+
+# One connection per thread (and process), reused across requests
+_pool = threading.local()
+
+# Set by migrate_database once the channels_fts full-text index is in place
+# (False if this SQLite build has no FTS5 - search then falls back to LIKE)
+FTS_ENABLED = False
+
+# Database init_db last ran against in this process, or in the gunicorn
+# master this worker was forked from (see gunicorn.conf.py)
+_initialized_db = None
+
+def _get_connection():
+    """Get this thread's pooled connection, opening it on first use"""
+    key = (os.getpid(), DB_NAME)
+    if getattr(_pool, 'key', None) != key:
+        # First use in this thread, or a forked worker / different database
+        conn = sqlite3.connect(DB_NAME, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        conn.row_factory = sqlite3.Row
+        for pragma in DB_PRAGMAS:
+            conn.execute(pragma)
+        _pool.conn = conn
+        _pool.key = key
+        _pool.depth = 0
+    return _pool.conn
+
 @contextmanager
 def get_db():
-    """Context manager for database connections"""
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    """
+    Context manager for database connections
+    Reuses this thread's pooled connection; nested uses share the outer
+    transaction, which is committed (or rolled back) when the outermost exits
+    """
+    conn = _get_connection()
+    _pool.depth += 1
     try:
         yield conn
-        conn.commit()
+        if _pool.depth == 1:
+            conn.commit()
     except Exception:
-        conn.rollback()
+        if _pool.depth == 1:
+            conn.rollback()
         raise
     finally:
+        _pool.depth -= 1
+
+def close_db():
+    """Close this thread's pooled connection, e.g. before forking workers"""
+    conn = getattr(_pool, 'conn', None)
+    if conn is not None and _pool.key[0] == os.getpid():
         conn.close()
+    _pool.conn = None
+    _pool.key = None
 
 def hash_password(password):
     """Hash a password using SHA-256"""
@@ -26,6 +100,7 @@ def hash_password(password):
 
 def migrate_database():
     """Migrate existing database to new schema"""
+    global FTS_ENABLED
     with get_db() as conn:
         cursor = conn.cursor()
         
@@ -86,6 +161,284 @@ def migrate_database():
             ''')
             print("✅ Created activity_log table")
         
+        # Check if activity_log_archive table exists (activity older than ACTIVITY_RETENTION_DAYS)
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='activity_log_archive'")
+        if not cursor.fetchone():
+            cursor.execute('''
+                CREATE TABLE activity_log_archive (
+                    id INTEGER PRIMARY KEY,
+                    user_id INTEGER,
+                    action TEXT NOT NULL,
+                    entity_type TEXT,
+                    entity_id INTEGER,
+                    details TEXT,
+                    created_at TIMESTAMP
+                )
+            ''')
+            print("✅ Created activity_log_archive table")
+        
+        # Check if app_meta table exists (key/value settings such as score_version)
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='app_meta'")
+        if not cursor.fetchone():
+            cursor.execute('''
+                CREATE TABLE app_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            ''')
+            print("✅ Created app_meta table")
+        
+        # Check if api_quota_usage table exists (daily YouTube API budget)
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='api_quota_usage'")
+        if not cursor.fetchone():
+            cursor.execute('''
+                CREATE TABLE api_quota_usage (
+                    day TEXT PRIMARY KEY,
+                    units_used INTEGER NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            print("✅ Created api_quota_usage table")
+        
+        # Check if api_cache table exists (persistent YouTube API response cache)
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='api_cache'")
+        if not cursor.fetchone():
+            cursor.execute('''
+                CREATE TABLE api_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    resource TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL
+                )
+            ''')
+            print("✅ Created api_cache table")
+        
+        # Check if jobs table exists (background job queue, see jobs.py)
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='jobs'")
+        if not cursor.fetchone():
+            cursor.execute('''
+                CREATE TABLE jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_type TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    params TEXT,
+                    progress TEXT,
+                    result TEXT,
+                    error TEXT,
+                    cancel_requested INTEGER DEFAULT 0,
+                    attempts INTEGER DEFAULT 0,
+                    worker TEXT,
+                    created_by INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    started_at TIMESTAMP,
+                    heartbeat_at TIMESTAMP,
+                    finished_at TIMESTAMP,
+                    FOREIGN KEY (created_by) REFERENCES users(id)
+                )
+            ''')
+            print("✅ Created jobs table")
+        
+        # Check if sweep_checkpoints table exists (which searches a fetch sweep has done, and when)
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='sweep_checkpoints'")
+        if not cursor.fetchone():
+            cursor.execute('''
+                CREATE TABLE sweep_checkpoints (
+                    country TEXT NOT NULL,
+                    keyword TEXT NOT NULL,
+                    search_order TEXT NOT NULL,
+                    page_token TEXT NOT NULL DEFAULT '',
+                    next_page_token TEXT,
+                    new_channels INTEGER DEFAULT 0,
+                    completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (country, keyword, search_order, page_token)
+                )
+            ''')
+            print("✅ Created sweep_checkpoints table")
+        
+        # Check if channel_handles table exists (handle → channel ID resolution index)
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='channel_handles'")
+        if not cursor.fetchone():
+            cursor.execute('''
+                CREATE TABLE channel_handles (
+                    handle TEXT PRIMARY KEY,
+                    channel_id TEXT,
+                    source TEXT,
+                    resolved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            # Seed from every custom URL we already store
+            cursor.execute('''
+                INSERT OR IGNORE INTO channel_handles (handle, channel_id, source)
+                SELECT LOWER(LTRIM(custom_url, '@')), channel_id, 'channels'
+                FROM channels
+                WHERE custom_url IS NOT NULL AND custom_url != ''
+            ''')
+            print(f"✅ Created channel_handles table ({cursor.rowcount} handles indexed)")
+        
+        # Keep the handle index filled as new channels are stored
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_channels_handle_insert
+            AFTER INSERT ON channels
+            WHEN NEW.custom_url IS NOT NULL AND NEW.custom_url != ''
+            BEGIN
+                INSERT OR REPLACE INTO channel_handles (handle, channel_id, source)
+                VALUES (LOWER(LTRIM(NEW.custom_url, '@')), NEW.channel_id, 'channels');
+            END
+        ''')
+        
+        # Check if channel_counters table exists (materialized /api/stats counts)
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='channel_counters'")
+        if not cursor.fetchone():
+            cursor.execute('''
+                CREATE TABLE channel_counters (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    total INTEGER NOT NULL DEFAULT 0,
+                    emailed INTEGER NOT NULL DEFAULT 0,
+                    not_emailed INTEGER NOT NULL DEFAULT 0,
+                    replied INTEGER NOT NULL DEFAULT 0,
+                    not_replied INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            cursor.execute('''
+                INSERT INTO channel_counters (id, total, emailed, not_emailed, replied, not_replied)
+                SELECT 1, COUNT(*),
+                       COALESCE(SUM(emailed IS 1), 0), COALESCE(SUM(emailed IS 0), 0),
+                       COALESCE(SUM(reply_received IS 1), 0), COALESCE(SUM(reply_received IS 0), 0)
+                FROM channels
+            ''')
+            print("✅ Created channel_counters table")
+        
+        # Keep the counters up to date on every insert, delete and status change
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_channel_counters_insert AFTER INSERT ON channels
+            BEGIN
+                UPDATE channel_counters SET
+                    total = total + 1,
+                    emailed = emailed + (NEW.emailed IS 1),
+                    not_emailed = not_emailed + (NEW.emailed IS 0),
+                    replied = replied + (NEW.reply_received IS 1),
+                    not_replied = not_replied + (NEW.reply_received IS 0)
+                WHERE id = 1;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_channel_counters_delete AFTER DELETE ON channels
+            BEGIN
+                UPDATE channel_counters SET
+                    total = total - 1,
+                    emailed = emailed - (OLD.emailed IS 1),
+                    not_emailed = not_emailed - (OLD.emailed IS 0),
+                    replied = replied - (OLD.reply_received IS 1),
+                    not_replied = not_replied - (OLD.reply_received IS 0)
+                WHERE id = 1;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_channel_counters_update
+            AFTER UPDATE OF emailed, reply_received ON channels
+            BEGIN
+                UPDATE channel_counters SET
+                    emailed = emailed + (NEW.emailed IS 1) - (OLD.emailed IS 1),
+                    not_emailed = not_emailed + (NEW.emailed IS 0) - (OLD.emailed IS 0),
+                    replied = replied + (NEW.reply_received IS 1) - (OLD.reply_received IS 1),
+                    not_replied = not_replied + (NEW.reply_received IS 0) - (OLD.reply_received IS 0)
+                WHERE id = 1;
+            END
+        ''')
+        
+        # Check if data_versions table exists (bumped on every write, used to invalidate caches)
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='data_versions'")
+        if not cursor.fetchone():
+            cursor.execute('''
+                CREATE TABLE data_versions (
+                    scope TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            print("✅ Created data_versions table")
+        for scope, table in DATA_VERSION_SCOPES.items():
+            cursor.execute('INSERT OR IGNORE INTO data_versions (scope, version) VALUES (?, 0)', (scope,))
+            for event in ('INSERT', 'UPDATE', 'DELETE'):
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()} AFTER {event} ON {table}
+                    BEGIN
+                        UPDATE data_versions SET version = version + 1 WHERE scope = '{scope}';
+                    END
+                ''')
+        
+        # Full-text index over title/description/keywords/custom_url (FTS5)
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='channels_fts'")
+        if cursor.fetchone():
+            FTS_ENABLED = True
+        else:
+            try:
+                cursor.execute('''
+                    CREATE VIRTUAL TABLE channels_fts USING fts5(
+                        title, description, keywords, custom_url,
+                        content='channels', content_rowid='id',
+                        tokenize='unicode61 remove_diacritics 2'
+                    )
+                ''')
+                cursor.execute("INSERT INTO channels_fts(channels_fts) VALUES ('rebuild')")
+                FTS_ENABLED = True
+                print("✅ Created channels_fts full-text index")
+            except sqlite3.OperationalError as e:
+                print(f"⚠️  Full-text search unavailable ({e}) - search will use LIKE")
+        
+        if FTS_ENABLED:
+            # Keep the full-text index in sync with channels
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_channels_fts_insert AFTER INSERT ON channels
+                BEGIN
+                    INSERT INTO channels_fts (rowid, title, description, keywords, custom_url)
+                    VALUES (NEW.id, NEW.title, NEW.description, NEW.keywords, NEW.custom_url);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_channels_fts_delete AFTER DELETE ON channels
+                BEGIN
+                    INSERT INTO channels_fts (channels_fts, rowid, title, description, keywords, custom_url)
+                    VALUES ('delete', OLD.id, OLD.title, OLD.description, OLD.keywords, OLD.custom_url);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_channels_fts_update
+                AFTER UPDATE OF title, description, keywords, custom_url ON channels
+                BEGIN
+                    INSERT INTO channels_fts (channels_fts, rowid, title, description, keywords, custom_url)
+                    VALUES ('delete', OLD.id, OLD.title, OLD.description, OLD.keywords, OLD.custom_url);
+                    INSERT INTO channels_fts (rowid, title, description, keywords, custom_url)
+                    VALUES (NEW.id, NEW.title, NEW.description, NEW.keywords, NEW.custom_url);
+                END
+            ''')
+        
+        # Daily analytics rollups (see ANALYTICS_ROLLUPS), kept current by triggers
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='channel_daily_rollup'")
+        if not cursor.fetchone():
+            cursor.execute('''
+                CREATE TABLE channel_daily_rollup (
+                    day TEXT NOT NULL,
+                    country_code TEXT NOT NULL,
+                    search_keyword TEXT NOT NULL,
+                    fetched INTEGER NOT NULL DEFAULT 0,
+                    emailed INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, country_code, search_keyword)
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE user_daily_rollup (
+                    day TEXT NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    emailed INTEGER NOT NULL DEFAULT 0,
+                    replied INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, user_id)
+                )
+            ''')
+            rebuild_analytics_rollups(cursor)
+            print("✅ Created analytics rollup tables")
+        create_rollup_triggers(cursor)
+        
         # Create indexes if they don't exist
         cursor.execute('''
             CREATE INDEX IF NOT EXISTS idx_emailed_by ON channels(emailed_by)
@@ -105,11 +458,46 @@ def migrate_database():
         cursor.execute('''
             CREATE INDEX IF NOT EXISTS idx_activity_created ON activity_log(created_at)
         ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_activity_action ON activity_log(action)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_api_cache_accessed ON api_cache(last_accessed)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id)
+        ''')
+        
+        # Composite indexes for dashboard filter + sort combinations
+        create_channel_indexes(cursor)
+        
+        # Sort keys for keyset pagination (id is implied as the rowid)
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_fetched_at ON channels(fetched_at)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_subscribers ON channels(subscribers)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_emailed_at ON channels(emailed_at)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_replied_at ON channels(replied_at)
+        ''')
         
         print("✅ Database migration completed")
 
+def db_initialized():
+    """Whether init_db already ran for DB_NAME in this process or the one it was forked from"""
+    return _initialized_db == DB_NAME
+
 def init_db():
-    """Initialize the database with required tables"""
+    """
+    Initialize the database with required tables
+    Also runs the one-off work: migrations, backfills, rescoring and archiving.
+    Under gunicorn this runs once in the master before workers are forked.
+    """
+    global _initialized_db
     with get_db() as conn:
         cursor = conn.cursor()
         
@@ -198,8 +586,19 @@ def init_db():
             ''', ('admin', 'admin@youtubeseo.com', default_password, 'admin'))
             print("✅ Created default admin user: username='admin', password='admin123'")
             print("⚠️  IMPORTANT: Change the default password after first login!")
-        
-        print("✅ Database initialized successfully")
+    
+    # Rescore stored channels only if the scoring formula changed
+    rescored = update_channel_priority_scores()
+    if rescored:
+        print(f"✅ Rescored {rescored} channels (score formula v{SCORE_FORMULA_VERSION})")
+    
+    # Move old activity out of the live feed
+    archived = archive_activity_log()
+    if archived:
+        print(f"✅ Archived {archived} activity log entries older than {ACTIVITY_RETENTION_DAYS:g} days")
+    
+    _initialized_db = DB_NAME
+    print("✅ Database initialized successfully")
 
 def channel_exists(channel_id):
     """Check if a channel already exists in the database"""
@@ -208,142 +607,459 @@ def channel_exists(channel_id):
         cursor.execute('SELECT id FROM channels WHERE channel_id = ?', (channel_id,))
         return cursor.fetchone() is not None
 
+CHANNEL_INSERT_SQL = '''
+    INSERT INTO channels (
+        channel_id, title, description, country, country_code,
+        subscribers, total_views, video_count, custom_url,
+        keywords, default_language, channel_url, search_keyword, priority_score
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+def _channel_row(channel_data):
+    """Build the CHANNEL_INSERT_SQL parameters for a fetched channel dict"""
+    return (
+        channel_data.get('Channel ID'),
+        channel_data.get('Title'),
+        channel_data.get('Description'),
+        channel_data.get('Country'),
+        channel_data.get('Country Code'),
+        channel_data.get('Subscribers'),
+        channel_data.get('Total Views'),
+        channel_data.get('Video Count'),
+        channel_data.get('Custom URL'),
+        channel_data.get('Keywords'),
+        channel_data.get('Default Language'),
+        channel_data.get('Channel URL'),
+        channel_data.get('Search Keyword'),
+        calculate_priority_score(channel_data)
+    )
+
 def add_channel(channel_data):
     """Add a new channel to the database"""
     with get_db() as conn:
         cursor = conn.cursor()
         try:
-            # Calculate priority score
-            priority_score = calculate_priority_score(channel_data)
-            
-            cursor.execute('''
-                INSERT INTO channels (
-                    channel_id, title, description, country, country_code,
-                    subscribers, total_views, video_count, custom_url,
-                    keywords, default_language, channel_url, search_keyword, priority_score
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                channel_data.get('Channel ID'),
-                channel_data.get('Title'),
-                channel_data.get('Description'),
-                channel_data.get('Country'),
-                channel_data.get('Country Code'),
-                channel_data.get('Subscribers'),
-                channel_data.get('Total Views'),
-                channel_data.get('Video Count'),
-                channel_data.get('Custom URL'),
-                channel_data.get('Keywords'),
-                channel_data.get('Default Language'),
-                channel_data.get('Channel URL'),
-                channel_data.get('Search Keyword'),
-                priority_score
-            ))
+            cursor.execute(CHANNEL_INSERT_SQL, _channel_row(channel_data))
             return True
         except sqlite3.IntegrityError:
             # Channel already exists
             return False
 
-def get_all_channels(emailed_filter=None, search_query=None, limit=100, offset=0, 
-                     country_filter=None, keyword_filter=None, min_subscribers=None, 
-                     max_subscribers=None, min_score=None, reply_filter=None, 
-                     sort_by='fetched_at', sort_order='DESC'):
-    """Get all channels with optional filters, including user info"""
+def add_channels(channels_data):
+    """
+    Add a batch of channels in a single transaction
+    Returns the list of channel IDs that were actually new
+    """
+    rows = {}
+    for channel_data in channels_data:
+        rows.setdefault(channel_data.get('Channel ID'), _channel_row(channel_data))
+    if not rows:
+        return []
+    
     with get_db() as conn:
         cursor = conn.cursor()
-        query = '''
-            SELECT c.*, 
-                   u1.username as emailed_by_username,
-                   u2.username as replied_by_username
-            FROM channels c
-            LEFT JOIN users u1 ON c.emailed_by = u1.id
-            LEFT JOIN users u2 ON c.replied_by = u2.id
-            WHERE 1=1
-        '''
-        params = []
+        # Take the write lock up front so the existence check can't go stale
+        if not conn.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+        channel_ids = list(rows)
+        existing = set()
+        for i in range(0, len(channel_ids), 500):  # stay under SQLite's variable limit
+            chunk = channel_ids[i:i+500]
+            placeholders = ','.join(['?'] * len(chunk))
+            cursor.execute(f'SELECT channel_id FROM channels WHERE channel_id IN ({placeholders})', chunk)
+            existing.update(row[0] for row in cursor.fetchall())
         
-        if emailed_filter is not None:
-            query += ' AND c.emailed = ?'
-            params.append(1 if emailed_filter else 0)
-        
-        if search_query:
-            query += ' AND (c.title LIKE ? OR c.description LIKE ? OR c.country LIKE ?)'
-            search_term = f'%{search_query}%'
-            params.extend([search_term, search_term, search_term])
-        
-        if country_filter:
-            query += ' AND c.country_code = ?'
-            params.append(country_filter)
-        
-        if keyword_filter:
-            query += ' AND c.search_keyword = ?'
-            params.append(keyword_filter)
-        
-        if min_subscribers is not None:
-            query += ' AND c.subscribers >= ?'
-            params.append(min_subscribers)
-        
-        if max_subscribers is not None:
-            query += ' AND c.subscribers <= ?'
-            params.append(max_subscribers)
-        
-        if min_score is not None:
-            query += ' AND c.priority_score >= ?'
-            params.append(min_score)
-        
-        if reply_filter is not None:
-            query += ' AND c.reply_received = ?'
-            params.append(1 if reply_filter else 0)
-        
-        # Sorting
-        valid_sort_fields = ['fetched_at', 'subscribers', 'priority_score', 'emailed_at', 'replied_at']
-        if sort_by not in valid_sort_fields:
-            sort_by = 'fetched_at'
-        sort_order = 'DESC' if sort_order.upper() == 'DESC' else 'ASC'
-        query += f' ORDER BY c.{sort_by} {sort_order} LIMIT ? OFFSET ?'
+        cursor.executemany(CHANNEL_INSERT_SQL.rstrip() + ' ON CONFLICT(channel_id) DO NOTHING', 
+                          rows.values())
+        return [cid for cid in channel_ids if cid not in existing]
+
+# Columns /api/channels can sort by (each is paired with id for keyset pagination)
+VALID_SORT_FIELDS = ['fetched_at', 'subscribers', 'priority_score', 'emailed_at', 'replied_at']
+
+# Extra sort for searches: bm25 rank (offset pagination only)
+RELEVANCE_SORT = 'relevance'
+
+# bm25 column weights for channels_fts: title, description, keywords, custom_url
+FTS_RANK = 'bm25(channels_fts, 10.0, 1.0, 5.0, 5.0)'
+
+def build_fts_query(search_query):
+    """
+    Turn dashboard search text into an FTS5 query
+    "quoted text" is matched as a phrase, other words as prefixes, all terms must match
+    Returns None if there is nothing to search for
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', search_query or ''):
+        if phrase.strip():
+            terms.append('"' + phrase.strip() + '"')
+        elif word:
+            word = word.replace('"', '')
+            if word:
+                terms.append('"' + word + '"*')
+    return ' '.join(terms) or None
+
+def _channel_filters(emailed_filter=None, search_query=None, country_filter=None, keyword_filter=None,
+                     min_subscribers=None, max_subscribers=None, min_score=None, reply_filter=None):
+    """Build the WHERE conditions (on alias c) and params shared by channel list queries"""
+    query = ''
+    params = []
+    
+    if emailed_filter is not None:
+        query += ' AND c.emailed = ?'
+        params.append(1 if emailed_filter else 0)
+    
+    if search_query and FTS_ENABLED:
+        fts_query = build_fts_query(search_query)
+        if fts_query:
+            query += ' AND c.id IN (SELECT rowid FROM channels_fts WHERE channels_fts MATCH ?)'
+            params.append(fts_query)
+    elif search_query:
+        query += ' AND (c.title LIKE ? OR c.description LIKE ? OR c.country LIKE ?)'
+        search_term = f'%{search_query}%'
+        params.extend([search_term, search_term, search_term])
+    
+    if country_filter:
+        query += ' AND c.country_code = ?'
+        params.append(country_filter)
+    
+    if keyword_filter:
+        query += ' AND c.search_keyword = ?'
+        params.append(keyword_filter)
+    
+    if min_subscribers is not None:
+        query += ' AND c.subscribers >= ?'
+        params.append(min_subscribers)
+    
+    if max_subscribers is not None:
+        query += ' AND c.subscribers <= ?'
+        params.append(max_subscribers)
+    
+    if min_score is not None:
+        query += ' AND c.priority_score >= ?'
+        params.append(min_score)
+    
+    if reply_filter is not None:
+        query += ' AND c.reply_received = ?'
+        params.append(1 if reply_filter else 0)
+    
+    return query, params
+
+def _normalize_sort(sort_by, sort_order):
+    if sort_by not in VALID_SORT_FIELDS:
+        sort_by = 'fetched_at'
+    sort_order = 'DESC' if (sort_order or '').upper() == 'DESC' else 'ASC'
+    return sort_by, sort_order
+
+def encode_channel_cursor(row, sort_by='fetched_at', sort_order='DESC'):
+    """Build an opaque cursor token pointing just after `row` in the given sort"""
+    sort_by, sort_order = _normalize_sort(sort_by, sort_order)
+    payload = json.dumps([sort_by, sort_order, row.get(sort_by), row['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_channel_cursor(token):
+    """Decode a cursor token into (sort_by, sort_order, sort_value, id); raises ValueError if invalid"""
+    try:
+        payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        sort_by, sort_order, value, last_id = json.loads(payload)
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if sort_by not in VALID_SORT_FIELDS or sort_order not in ('ASC', 'DESC') or not isinstance(last_id, int):
+        raise ValueError('Invalid cursor')
+    return sort_by, sort_order, value, last_id
+
+def _keyset_condition(sort_by, sort_order, value, last_id):
+    """
+    WHERE condition for rows after (value, last_id) in ORDER BY sort_by, id.
+    SQLite sorts NULLs first in ASC and last in DESC, so NULL sort values
+    are handled explicitly.
+    """
+    column = f'c.{sort_by}'
+    if sort_order == 'DESC':
+        if value is None:
+            return f' AND ({column} IS NULL AND c.id < ?)', [last_id]
+        return f' AND (({column}, c.id) < (?, ?) OR {column} IS NULL)', [value, last_id]
+    if value is None:
+        return f' AND (({column} IS NULL AND c.id > ?) OR {column} IS NOT NULL)', [last_id]
+    return f' AND ({column}, c.id) > (?, ?)', [value, last_id]
+
+def _build_channels_query(emailed_filter=None, search_query=None, limit=100, offset=0, 
+                          country_filter=None, keyword_filter=None, min_subscribers=None, 
+                          max_subscribers=None, min_score=None, reply_filter=None, 
+                          sort_by='fetched_at', sort_order='DESC', cursor=None, extra_columns=()):
+    """
+    Build the SQL and params for get_all_channels
+    extra_columns: (sql, params) pairs added to the select list, e.g. scalar subqueries
+    """
+    fts_query = build_fts_query(search_query) if FTS_ENABLED else None
+    relevance = sort_by == RELEVANCE_SORT and fts_query and not cursor
+    query = '''
+        SELECT c.*, 
+               u1.username as emailed_by_username,
+               u2.username as replied_by_username
+    '''
+    select_params = []
+    for column_sql, column_params in extra_columns:
+        query += f', {column_sql}'
+        select_params.extend(column_params)
+    if relevance:
+        query += '''
+        FROM channels_fts
+        JOIN channels c ON c.id = channels_fts.rowid
+        LEFT JOIN users u1 ON c.emailed_by = u1.id
+        LEFT JOIN users u2 ON c.replied_by = u2.id
+        WHERE channels_fts MATCH ?
+        '''
+        params = select_params + [fts_query]
+        search_query = None  # already matched above
+    else:
+        query += '''
+        FROM channels c
+        LEFT JOIN users u1 ON c.emailed_by = u1.id
+        LEFT JOIN users u2 ON c.replied_by = u2.id
+        WHERE 1=1
+        '''
+        params = select_params
+    filters, filter_params = _channel_filters(emailed_filter, search_query, country_filter, keyword_filter,
+                                              min_subscribers, max_subscribers, min_score, reply_filter)
+    query += filters
+    params.extend(filter_params)
+    
+    # Sorting (id breaks ties so keyset pages are stable)
+    if relevance:
+        query += f' ORDER BY {FTS_RANK}, c.id LIMIT ? OFFSET ?'
         params.extend([limit, offset])
-        
-        cursor.execute(query, params)
-        return [dict(row) for row in cursor.fetchall()]
+        return query, params
+    if cursor:
+        sort_by, sort_order, value, last_id = decode_channel_cursor(cursor)
+        condition, keyset_params = _keyset_condition(sort_by, sort_order, value, last_id)
+        query += condition
+        params.extend(keyset_params)
+        offset = 0
+    else:
+        sort_by, sort_order = _normalize_sort(sort_by, sort_order)
+    query += f' ORDER BY c.{sort_by} {sort_order}, c.id {sort_order} LIMIT ? OFFSET ?'
+    params.extend([limit, offset])
+    return query, params
+
+def get_all_channels(emailed_filter=None, search_query=None, limit=100, offset=0, 
+                     country_filter=None, keyword_filter=None, min_subscribers=None, 
+                     max_subscribers=None, min_score=None, reply_filter=None, 
+                     sort_by='fetched_at', sort_order='DESC', cursor=None):
+    """
+    Get all channels with optional filters, including user info
+    Pass a cursor token (see encode_channel_cursor) instead of an offset to
+    page by keyset - its sort overrides sort_by/sort_order and offset is ignored.
+    sort_by='relevance' ranks full-text search matches by bm25 (offset paging only).
+    """
+    query, params = _build_channels_query(emailed_filter, search_query, limit, offset, country_filter,
+                                          keyword_filter, min_subscribers, max_subscribers, min_score,
+                                          reply_filter, sort_by, sort_order, cursor)
+    with get_db() as conn:
+        db_cursor = conn.cursor()
+        db_cursor.execute(query, params)
+        return [dict(row) for row in db_cursor.fetchall()]
+
+def iter_channels(emailed_filter=None, search_query=None, country_filter=None, keyword_filter=None,
+                  min_subscribers=None, max_subscribers=None, min_score=None, reply_filter=None,
+                  sort_by='fetched_at', sort_order='DESC', chunk_size=1000):
+    """
+    Iterate over every matching channel (same filters as get_all_channels, no limit)
+    Rows are fetched from a single cursor chunk_size at a time, so memory stays
+    flat however many channels match.
+    """
+    query, params = _build_channels_query(emailed_filter, search_query, -1, 0, country_filter,
+                                          keyword_filter, min_subscribers, max_subscribers, min_score,
+                                          reply_filter, sort_by, sort_order)
+    with get_db() as conn:
+        db_cursor = conn.cursor()
+        db_cursor.execute(query, params)
+        while True:
+            rows = db_cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+
+def _build_count_query(emailed_filter=None, country_filter=None, keyword_filter=None, 
+                       min_subscribers=None, max_subscribers=None, min_score=None, reply_filter=None,
+                       search_query=None):
+    """Build the SQL and params for get_channel_count"""
+    filters, params = _channel_filters(emailed_filter, search_query, country_filter, keyword_filter,
+                                       min_subscribers, max_subscribers, min_score, reply_filter)
+    return 'SELECT COUNT(*) FROM channels c WHERE 1=1' + filters, params
 
 def get_channel_count(emailed_filter=None, country_filter=None, keyword_filter=None, 
-                     min_subscribers=None, max_subscribers=None, min_score=None, reply_filter=None):
+                     min_subscribers=None, max_subscribers=None, min_score=None, reply_filter=None,
+                     search_query=None):
     """Get total count of channels with filters"""
+    query, params = _build_count_query(emailed_filter, country_filter, keyword_filter,
+                                       min_subscribers, max_subscribers, min_score, reply_filter,
+                                       search_query)
     with get_db() as conn:
         cursor = conn.cursor()
-        query = 'SELECT COUNT(*) FROM channels WHERE 1=1'
-        params = []
-        
-        if emailed_filter is not None:
-            query += ' AND emailed = ?'
-            params.append(1 if emailed_filter else 0)
-        
-        if country_filter:
-            query += ' AND country_code = ?'
-            params.append(country_filter)
-        
-        if keyword_filter:
-            query += ' AND search_keyword = ?'
-            params.append(keyword_filter)
-        
-        if min_subscribers is not None:
-            query += ' AND subscribers >= ?'
-            params.append(min_subscribers)
-        
-        if max_subscribers is not None:
-            query += ' AND subscribers <= ?'
-            params.append(max_subscribers)
-        
-        if min_score is not None:
-            query += ' AND priority_score >= ?'
-            params.append(min_score)
-        
-        if reply_filter is not None:
-            query += ' AND reply_received = ?'
-            params.append(1 if reply_filter else 0)
-        
         cursor.execute(query, params)
         return cursor.fetchone()[0]
 
+def get_data_version(scope='channels'):
+    """Get the write counter for a scope (bumped by triggers on every insert/update/delete)"""
+    return get_data_versions([scope])[scope]
+
+def get_data_versions(scopes):
+    """Get the write counters for several scopes in one query: {scope: version}"""
+    scopes = list(scopes)
+    if 'activity' in scopes:
+        ACTIVITY_LOG.flush()  # count events still waiting in this process's buffer
+    with get_db() as conn:
+        cursor = conn.cursor()
+        placeholders = ','.join(['?'] * len(scopes))
+        cursor.execute(f'SELECT scope, version FROM data_versions WHERE scope IN ({placeholders})', scopes)
+        versions = dict(cursor.fetchall())
+        return {scope: versions.get(scope, 0) for scope in scopes}
+
+# Filtered totals for /api/channels, keyed by filter signature:
+# {signature: (channels data version, count)}. An entry is only used while
+# the data version it was counted at is still current.
+CHANNEL_COUNT_CACHE_SIZE = 256
+_channel_count_cache = {}
+_channel_count_lock = threading.Lock()
+
+def get_channel_page(emailed_filter=None, search_query=None, limit=100, offset=0, 
+                     country_filter=None, keyword_filter=None, min_subscribers=None, 
+                     max_subscribers=None, min_score=None, reply_filter=None, 
+                     sort_by='fetched_at', sort_order='DESC', cursor=None):
+    """
+    Get a page of channels and the total matching count in one round trip
+    Same arguments as get_all_channels. Returns (channels, total).
+    The total comes from a per-process cache keyed by the filters and checked
+    against the channels data version that the page query reads alongside
+    the rows; on a miss it's counted by a subquery in the same statement.
+    """
+    count_args = (emailed_filter, country_filter, keyword_filter, min_subscribers,
+                  max_subscribers, min_score, reply_filter, search_query or None)
+    signature = repr(count_args)
+    with _channel_count_lock:
+        cached = _channel_count_cache.get(signature)
+    
+    extra_columns = [("(SELECT version FROM data_versions WHERE scope = 'channels') AS _data_version", [])]
+    if cached is None:
+        count_query, count_params = _build_count_query(*count_args)
+        extra_columns.append((f'({count_query}) AS _total_count', count_params))
+    query, params = _build_channels_query(emailed_filter, search_query, limit, offset, country_filter,
+                                          keyword_filter, min_subscribers, max_subscribers, min_score,
+                                          reply_filter, sort_by, sort_order, cursor, extra_columns)
+    with get_db() as conn:
+        db_cursor = conn.cursor()
+        db_cursor.execute(query, params)
+        channels = [dict(row) for row in db_cursor.fetchall()]
+        
+        if channels:
+            version = channels[0]['_data_version']
+            total = channels[0].get('_total_count')
+            for channel in channels:
+                channel.pop('_data_version')
+                channel.pop('_total_count', None)
+        else:
+            # Empty page - no row to carry the version/count
+            version = get_data_version('channels')
+            total = None
+        
+        if total is None:
+            if cached is not None and cached[0] == version:
+                total = cached[1]
+            else:
+                total = get_channel_count(*count_args)
+    
+    with _channel_count_lock:
+        if len(_channel_count_cache) >= CHANNEL_COUNT_CACHE_SIZE and signature not in _channel_count_cache:
+            _channel_count_cache.pop(next(iter(_channel_count_cache)))
+        _channel_count_cache[signature] = (version, total)
+    return channels, total
+
+# ==================== INDEX PLANNING ====================
+
+# Composite indexes matched to the dashboard's filter + sort combinations:
+# equality filters (emailed, country_code, search_keyword, reply_received)
+# first, then the sort column, so filtered pages are read in order and
+# counts are answered from the index alone
+CHANNEL_INDEXES = {
+    'idx_emailed_fetched': ('emailed', 'fetched_at'),
+    'idx_emailed_score': ('emailed', 'priority_score'),
+    'idx_emailed_subscribers': ('emailed', 'subscribers'),
+    'idx_emailed_emailed_at': ('emailed', 'emailed_at'),
+    'idx_country_emailed_fetched': ('country_code', 'emailed', 'fetched_at'),
+    'idx_country_emailed_score': ('country_code', 'emailed', 'priority_score'),
+    'idx_keyword_emailed_fetched': ('search_keyword', 'emailed', 'fetched_at'),
+    'idx_keyword_emailed_score': ('search_keyword', 'emailed', 'priority_score'),
+    'idx_reply_replied_at': ('reply_received', 'replied_at'),
+    'idx_emailed_reply': ('emailed', 'reply_received'),
+}
+
+def create_channel_indexes(cursor):
+    """Create every index in CHANNEL_INDEXES"""
+    for name, columns in CHANNEL_INDEXES.items():
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON channels({", ".join(columns)})')
+
+# Representative dashboard queries that must not fall back to a full table scan
+QUERY_PLAN_CASES = [
+    ('default list', 'list', {}),
+    ('not emailed by score', 'list', {'emailed_filter': False, 'sort_by': 'priority_score'}),
+    ('not emailed by date', 'list', {'emailed_filter': False}),
+    ('emailed by emailed date', 'list', {'emailed_filter': True, 'sort_by': 'emailed_at'}),
+    ('country + not emailed by score', 'list', 
+     {'emailed_filter': False, 'country_filter': 'US', 'sort_by': 'priority_score'}),
+    ('keyword + not emailed by date', 'list', {'emailed_filter': False, 'keyword_filter': 'fitness'}),
+    ('subscriber range by subscribers', 'list', 
+     {'min_subscribers': 1000, 'max_subscribers': 50000, 'sort_by': 'subscribers'}),
+    ('min score by score', 'list', {'min_score': 50, 'sort_by': 'priority_score'}),
+    ('replied by reply date', 'list', {'reply_filter': True, 'sort_by': 'replied_at'}),
+    ('search', 'list', {'search_query': 'fitness'}),
+    ('count all', 'count', {}),
+    ('count not emailed', 'count', {'emailed_filter': False}),
+    ('count replied', 'count', {'reply_filter': True}),
+    ('count country + not emailed', 'count', {'emailed_filter': False, 'country_filter': 'US'}),
+    ('count keyword', 'count', {'keyword_filter': 'fitness'}),
+]
+
+def explain_query_plan(query, params):
+    """Get the EXPLAIN QUERY PLAN detail lines for a query"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + query, params)
+        return [row[3] for row in cursor.fetchall()]
+
+def check_channel_query_plans():
+    """
+    Check QUERY_PLAN_CASES against the current schema
+    Returns a list of (case name, plan) for queries that full-scan channels
+    """
+    problems = []
+    for name, kind, kwargs in QUERY_PLAN_CASES:
+        if kind == 'count':
+            query, params = _build_count_query(**kwargs)
+        else:
+            query, params = _build_channels_query(limit=50, **kwargs)
+        plan = explain_query_plan(query, params)
+        # "SCAN c" (no index) reads the whole table; "SCAN c USING ... INDEX" doesn't
+        if any(re.fullmatch(r'SCAN (c|channels)', line.strip()) for line in plan):
+            problems.append((name, plan))
+    return problems
+
+def get_channel_stats():
+    """
+    Get dashboard totals (total, emailed, not_emailed, replied, not_replied)
+    Read from the trigger-maintained channel_counters row, so it doesn't scan channels
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT total, emailed, not_emailed, replied, not_replied
+            FROM channel_counters WHERE id = 1
+        ''')
+        row = cursor.fetchone()
+        if not row:
+            return {'total': 0, 'emailed': 0, 'not_emailed': 0, 'replied': 0, 'not_replied': 0}
+        return dict(row)
+
 def update_emailed_status(channel_ids, emailed=True, user_id=None):
     """Update emailed status for channels"""
     with get_db() as conn:
@@ -388,13 +1104,14 @@ def update_channel_notes(channel_id, notes, user_id=None):
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('UPDATE channels SET notes = ? WHERE id = ?', (notes, channel_id))
-        
-        # Log activity
-        if user_id:
-            log_activity(user_id, 'updated_notes', 'channel', channel_id, 
-                        f'Updated notes: {notes[:50]}')
-        
-        return cursor.rowcount
+        updated = cursor.rowcount
+    
+    # Log activity
+    if user_id:
+        log_activity(user_id, 'updated_notes', 'channel', channel_id, 
+                    f'Updated notes: {notes[:50]}')
+    
+    return updated
 
 def get_fetched_channel_ids():
     """Get all channel IDs that have already been fetched"""
@@ -431,13 +1148,42 @@ def get_user_by_username(username):
         row = cursor.fetchone()
         return dict(row) if row else None
 
-def get_user_by_id(user_id):
-    """Get user by ID"""
+# Active users by ID, cached per process for auth checks: {user_id: (expires_at, user)}
+# Writes through the functions below invalidate immediately; changes made by
+# another process show up within USER_CACHE_TTL seconds.
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 30))
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+
+def invalidate_user_cache(user_id=None):
+    """Drop a user (or everyone, if user_id is None) from the user cache"""
+    with _user_cache_lock:
+        if user_id is None:
+            _user_cache.clear()
+        else:
+            _user_cache.pop(user_id, None)
+
+def get_user_by_id(user_id, use_cache=True):
+    """Get user by ID (served from the in-process user cache when fresh)"""
+    now = time.monotonic()
+    if use_cache:
+        with _user_cache_lock:
+            cached = _user_cache.get(user_id)
+        if cached and cached[0] > now:
+            return dict(cached[1])
+    
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM users WHERE id = ? AND is_active = 1', (user_id,))
         row = cursor.fetchone()
-        return dict(row) if row else None
+        user = dict(row) if row else None
+    
+    with _user_cache_lock:
+        if user:
+            _user_cache[user_id] = (now + USER_CACHE_TTL, dict(user))
+        else:
+            _user_cache.pop(user_id, None)
+    return user
 
 def get_all_users():
     """Get all users"""
@@ -451,7 +1197,10 @@ def delete_user(user_id):
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('UPDATE users SET is_active = 0 WHERE id = ?', (user_id,))
-        return cursor.rowcount
+        deleted = cursor.rowcount
+    # After the commit, so a concurrent lookup can't re-cache the old row
+    invalidate_user_cache(user_id)
+    return deleted
 
 def update_user_password(user_id, new_password):
     """Update user password"""
@@ -459,76 +1208,206 @@ def update_user_password(user_id, new_password):
         cursor = conn.cursor()
         password_hash = hash_password(new_password)
         cursor.execute('UPDATE users SET password_hash = ? WHERE id = ?', (password_hash, user_id))
-        return cursor.rowcount
+        updated = cursor.rowcount
+    invalidate_user_cache(user_id)
+    return updated
 
 def get_user_stats(user_id):
     """Get statistics for a specific user"""
     with get_db() as conn:
         cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM channels WHERE emailed_by = ?', (user_id,))
-        channels_emailed = cursor.fetchone()[0]
-        cursor.execute('SELECT COUNT(*) FROM channels WHERE replied_by = ?', (user_id,))
-        replies_received = cursor.fetchone()[0]
+        cursor.execute('''
+            SELECT (SELECT COUNT(*) FROM channels WHERE emailed_by = ?),
+                   (SELECT COUNT(*) FROM channels WHERE replied_by = ?)
+        ''', (user_id, user_id))
+        channels_emailed, replies_received = cursor.fetchone()
         return {
             'channels_emailed': channels_emailed,
             'replies_received': replies_received
         }
 
-def calculate_priority_score(channel):
-    """Calculate priority score based on engagement metrics"""
+def get_meta(key, default=None):
+    """Get a value from the app_meta table"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT value FROM app_meta WHERE key = ?', (key,))
+        row = cursor.fetchone()
+        return row[0] if row else default
+
+def set_meta(key, value):
+    """Set a value in the app_meta table"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('INSERT OR REPLACE INTO app_meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+def calculate_priority_score(channel, version=None, weights=None):
+    """
+    Calculate priority score based on engagement metrics
+    Accepts a database row (subscribers, total_views, video_count) or a
+    fetched channel dict (Subscribers, Total Views, Video Count)
+    """
     try:
-        subscribers = int(channel.get('subscribers', 0) or 0)
-        views = int(channel.get('total_views', 0) or 0)
-        videos = int(channel.get('video_count', 0) or 0)
-        
-        # Score calculation (weighted)
-        # Subscriber score (0-40 points): More subscribers = higher score
-        sub_score = min(40, subscribers / 2500)  # 100k subs = 40 points
-        
-        # Engagement score (0-30 points): Views per subscriber ratio
-        if subscribers > 0:
-            engagement = views / subscribers
-            engagement_score = min(30, engagement / 10)  # 100 views/sub = 30 points
-        else:
-            engagement_score = 0
-        
-        # Activity score (0-30 points): More videos = more active
-        activity_score = min(30, videos / 10)  # 300 videos = 30 points
-        
-        total_score = sub_score + engagement_score + activity_score
-        return round(total_score, 2)
+        subscribers = int(channel.get('subscribers', channel.get('Subscribers', 0)) or 0)
+        views = int(channel.get('total_views', channel.get('Total Views', 0)) or 0)
+        videos = int(channel.get('video_count', channel.get('Video Count', 0)) or 0)
+        return score_values(subscribers, views, videos, version=version, weights=weights)
     except:
         return 0.0
 
-def update_channel_priority_scores():
-    """Update priority scores for all channels"""
+def _iter_scoring_frames(where_sql=None, params=(), chunk_size=50000):
+    """Read the scoring columns of (optionally filtered) channels in DataFrame chunks"""
+    query = 'SELECT id, subscribers, total_views, video_count, priority_score FROM channels'
+    if where_sql:
+        query += f' WHERE {where_sql}'
     with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM channels')
-        channels = cursor.fetchall()
-        
-        updated = 0
-        for channel_row in channels:
-            channel = dict(channel_row)
-            score = calculate_priority_score(channel)
-            cursor.execute('UPDATE channels SET priority_score = ? WHERE id = ?', 
-                         (score, channel['id']))
-            updated += 1
-        
-        return updated
+        yield from pd.read_sql_query(query, conn, params=list(params), chunksize=chunk_size)
 
-def log_activity(user_id, action, entity_type=None, entity_id=None, details=None):
-    """Log user activity"""
+def preview_priority_scores(version=None, weights=None, where_sql=None, params=()):
+    """
+    Score channels with any formula version or ad-hoc weight set without saving
+    Returns a DataFrame with id, priority_score (stored) and new_score
+    """
+    frames = []
+    for df in _iter_scoring_frames(where_sql, params):
+        df['new_score'] = score_frame(df, version=version, weights=weights)
+        frames.append(df[['id', 'priority_score', 'new_score']])
+    if not frames:
+        return pd.DataFrame(columns=['id', 'priority_score', 'new_score'])
+    return pd.concat(frames, ignore_index=True)
+
+def rescore_channels(version=None, weights=None, where_sql=None, params=()):
+    """
+    Recompute and store priority scores in vectorized batches
+    where_sql/params restrict it to a subset (e.g. 'country_code = ?', ['US'])
+    Returns the number of channels rescored
+    """
+    updated = 0
     with get_db() as conn:
         cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO activity_log (user_id, action, entity_type, entity_id, details)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, action, entity_type, entity_id, details))
-        return cursor.lastrowid
+        for df in _iter_scoring_frames(where_sql, params):
+            scores = score_frame(df, version=version, weights=weights)
+            cursor.executemany('UPDATE channels SET priority_score = ? WHERE id = ?',
+                              zip(scores.tolist(), df['id'].tolist()))
+            updated += len(df)
+    return updated
 
-def get_activity_log(limit=100, user_id=None, action=None):
-    """Get activity log entries"""
+def update_channel_priority_scores(force=False):
+    """
+    Recompute stored priority scores for all channels
+    Scores are calculated at ingest time, so this only runs when
+    SCORE_FORMULA_VERSION differs from the stored score_version (or force=True).
+    Returns the number of channels rescored
+    """
+    if not force and get_meta('score_version') == str(SCORE_FORMULA_VERSION):
+        return 0
+    
+    with get_db() as conn:
+        # Re-check under the write lock so processes starting together rescore once
+        if not conn.in_transaction:
+            conn.execute('BEGIN IMMEDIATE')
+        if not force and get_meta('score_version') == str(SCORE_FORMULA_VERSION):
+            return 0
+        updated = rescore_channels(version=SCORE_FORMULA_VERSION)
+        set_meta('score_version', SCORE_FORMULA_VERSION)
+        return updated
+
+# Activity log buffering: events are written in batches once this many are
+# waiting or the oldest has waited this long (seconds)
+ACTIVITY_LOG_BATCH_SIZE = int(os.environ.get('ACTIVITY_LOG_BATCH_SIZE', 100))
+ACTIVITY_LOG_FLUSH_SECONDS = float(os.environ.get('ACTIVITY_LOG_FLUSH_SECONDS', 2))
+# Audit-critical actions are always written before log_activity returns
+AUDIT_ACTIONS = {'changed_password', 'reset_password', 'created_user', 'deleted_user'}
+
+ACTIVITY_INSERT_SQL = '''
+    INSERT INTO activity_log (user_id, action, entity_type, entity_id, details, created_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+class ActivityLogWriter:
+    """Buffers activity_log rows and writes them in batched transactions from a background thread"""
+
+    def __init__(self, batch_size=ACTIVITY_LOG_BATCH_SIZE, flush_seconds=ACTIVITY_LOG_FLUSH_SECONDS):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.buffer = []
+        self.thread = None
+        self.pid = None
+
+    def add(self, row):
+        with self.lock:
+            self._ensure_thread()
+            self.buffer.append(row)
+            if len(self.buffer) >= self.batch_size:
+                self.wakeup.set()
+
+    def _ensure_thread(self):
+        # A forked worker inherits the buffer but not the thread
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.buffer = []
+            self.thread = threading.Thread(target=self._run, name='activity-log', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.flush_seconds)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️  Activity log flush failed: {e}")
+
+    def flush(self):
+        """Write all buffered rows in one transaction (kept for the next flush if it fails)"""
+        with self.flush_lock:
+            with self.lock:
+                rows, self.buffer = self.buffer, []
+            if not rows:
+                return 0
+            try:
+                with get_db() as conn:
+                    conn.cursor().executemany(ACTIVITY_INSERT_SQL, rows)
+            except Exception:
+                with self.lock:
+                    self.buffer[:0] = rows
+                raise
+            return len(rows)
+
+ACTIVITY_LOG = ActivityLogWriter()
+
+@atexit.register
+def _flush_activity_log():
+    try:
+        ACTIVITY_LOG.flush()
+    except Exception as e:
+        print(f"⚠️  Activity log flush failed: {e}")
+
+def log_activity(user_id, action, entity_type=None, entity_id=None, details=None, sync=False):
+    """
+    Log user activity
+    Events are buffered and written in batches by ACTIVITY_LOG; audit-critical
+    actions (AUDIT_ACTIONS) and sync=True are written immediately instead.
+    """
+    created_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    row = (user_id, action, entity_type, entity_id, details, created_at)
+    if sync or action in AUDIT_ACTIONS:
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute(ACTIVITY_INSERT_SQL, row)
+            return cursor.lastrowid
+    ACTIVITY_LOG.add(row)
+    return None
+
+def get_activity_log(limit=100, user_id=None, action=None, since_id=None, before_id=None):
+    """
+    Get activity log entries, newest first (by id)
+    since_id returns only entries newer than that id (for polling);
+    before_id returns the page of entries older than that id.
+    """
+    ACTIVITY_LOG.flush()  # include events still waiting in this process's buffer
     with get_db() as conn:
         cursor = conn.cursor()
         query = '''
@@ -547,53 +1426,447 @@ def get_activity_log(limit=100, user_id=None, action=None):
             query += ' AND al.action = ?'
             params.append(action)
         
-        query += ' ORDER BY al.created_at DESC LIMIT ?'
+        if since_id is not None:
+            query += ' AND al.id > ?'
+            params.append(since_id)
+        
+        if before_id is not None:
+            query += ' AND al.id < ?'
+            params.append(before_id)
+        
+        query += ' ORDER BY al.id DESC LIMIT ?'
         params.append(limit)
         
         cursor.execute(query, params)
         return [dict(row) for row in cursor.fetchall()]
 
+# Activity older than this many days is moved to activity_log_archive (0 keeps everything)
+ACTIVITY_RETENTION_DAYS = float(os.environ.get('ACTIVITY_RETENTION_DAYS', 90))
+
+def archive_activity_log(retention_days=None):
+    """
+    Move activity_log entries older than retention_days into activity_log_archive
+    Returns the number of entries archived
+    """
+    if retention_days is None:
+        retention_days = ACTIVITY_RETENTION_DAYS
+    if not retention_days or retention_days <= 0:
+        return 0
+    cutoff = f'-{retention_days:g} days'
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT OR IGNORE INTO activity_log_archive
+                (id, user_id, action, entity_type, entity_id, details, created_at)
+            SELECT id, user_id, action, entity_type, entity_id, details, created_at
+            FROM activity_log WHERE created_at < datetime('now', ?)
+        ''', (cutoff,))
+        cursor.execute("DELETE FROM activity_log WHERE created_at < datetime('now', ?)", (cutoff,))
+        return cursor.rowcount
+
+# ==================== API QUOTA FUNCTIONS ====================
+
+def reserve_api_quota(day, units, limit):
+    """
+    Atomically charge `units` to the day's API usage if the total stays within `limit`
+    Returns True if the units were reserved, False if the budget would be exceeded
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('INSERT OR IGNORE INTO api_quota_usage (day, units_used) VALUES (?, 0)', (day,))
+        cursor.execute('''
+            UPDATE api_quota_usage
+            SET units_used = units_used + ?, updated_at = CURRENT_TIMESTAMP
+            WHERE day = ? AND units_used + ? <= ?
+        ''', (units, day, units, limit))
+        return cursor.rowcount > 0
+
+def get_api_quota_usage(day):
+    """Get API units used on a given quota day"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT units_used FROM api_quota_usage WHERE day = ?', (day,))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+def mark_api_quota_exhausted(day, daily_quota):
+    """Record that the API reported the quota as exhausted for the day"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('INSERT OR IGNORE INTO api_quota_usage (day, units_used) VALUES (?, 0)', (day,))
+        cursor.execute('''
+            UPDATE api_quota_usage
+            SET units_used = MAX(units_used, ?), updated_at = CURRENT_TIMESTAMP
+            WHERE day = ?
+        ''', (daily_quota, day))
+
+# ==================== SWEEP CHECKPOINT FUNCTIONS ====================
+
+def get_sweep_checkpoints():
+    """
+    Get the most recently completed page of each (country, keyword, search_order) search
+    Returns {(country, keyword, search_order): (completed_at, next_page_token)}
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT country, keyword, search_order, completed_at, next_page_token
+            FROM sweep_checkpoints
+            WHERE rowid IN (SELECT MAX(rowid) FROM sweep_checkpoints GROUP BY country, keyword, search_order)
+        ''')
+        return {(row[0], row[1], row[2]): (row[3], row[4]) for row in cursor.fetchall()}
+
+def save_sweep_checkpoint(country, keyword, search_order, page_token='', next_page_token=None, new_channels=0):
+    """Record that a sweep search (one results page) was completed"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        # Replaced rather than updated, so the latest page of a search always has the highest rowid
+        cursor.execute('''
+            INSERT OR REPLACE INTO sweep_checkpoints (country, keyword, search_order, page_token,
+                                                      next_page_token, new_channels, completed_at)
+            VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (country, keyword, search_order, page_token or '', next_page_token, new_channels))
+
+# ==================== HANDLE INDEX FUNCTIONS ====================
+
+def normalize_handle(handle):
+    """Normalize a handle / custom URL for lookups (case-insensitive, no @)"""
+    return handle.strip().lstrip('@').lower()
+
+def get_handle_resolution(handle, negative_ttl_seconds=86400):
+    """
+    Look up a handle in the resolution index
+    Returns (found, channel_id) - channel_id is None for a cached "doesn't exist",
+    which only counts while it is younger than negative_ttl_seconds
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT channel_id FROM channel_handles
+            WHERE handle = ?
+            AND (channel_id IS NOT NULL OR resolved_at >= datetime('now', ?))
+        ''', (normalize_handle(handle), f'-{int(negative_ttl_seconds)} seconds'))
+        row = cursor.fetchone()
+        return (True, row[0]) if row else (False, None)
+
+def save_handle_resolution(handle, channel_id, source):
+    """Record a handle resolution (channel_id=None records that the handle doesn't exist)"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT OR REPLACE INTO channel_handles (handle, channel_id, source, resolved_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (normalize_handle(handle), channel_id, source))
+
+# ==================== API CACHE FUNCTIONS ====================
+
+def get_cached_response(cache_key, now):
+    """Get a cached API response (JSON text) if it hasn't expired, marking it as recently used"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT response FROM api_cache WHERE cache_key = ? AND expires_at > ?', 
+                      (cache_key, now))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        cursor.execute('UPDATE api_cache SET last_accessed = ? WHERE cache_key = ?', (now, cache_key))
+        return row[0]
+
+def set_cached_response(cache_key, resource, response, expires_at, now):
+    """Store an API response (JSON text) in the cache"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT OR REPLACE INTO api_cache (cache_key, resource, response, expires_at, last_accessed)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (cache_key, resource, response, expires_at, now))
+
+def evict_cached_responses(max_entries, now):
+    """Drop expired cache entries and the least recently used ones beyond max_entries"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM api_cache WHERE expires_at <= ?', (now,))
+        expired = cursor.rowcount
+        cursor.execute('''
+            DELETE FROM api_cache WHERE cache_key IN (
+                SELECT cache_key FROM api_cache
+                ORDER BY last_accessed DESC
+                LIMIT -1 OFFSET ?
+            )
+        ''', (max_entries,))
+        return expired + cursor.rowcount
+
+def get_cache_entry_counts():
+    """Get the number of cached API responses per resource type"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT resource, COUNT(*) FROM api_cache GROUP BY resource')
+        return {row[0]: row[1] for row in cursor.fetchall()}
+
+# ==================== JOB QUEUE FUNCTIONS ====================
+
+def _job_row(row):
+    """Convert a jobs row to a dict with its JSON columns decoded"""
+    job = dict(row)
+    for key in ('params', 'progress', 'result'):
+        job[key] = json.loads(job[key]) if job[key] else {}
+    return job
+
+def create_job(job_type, params=None, user_id=None):
+    """Queue a background job, returns its ID"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO jobs (job_type, params, progress, created_by) VALUES (?, ?, '{}', ?)
+        ''', (job_type, json.dumps(params or {}), user_id))
+        return cursor.lastrowid
+
+def claim_job(worker_id, stale_seconds):
+    """
+    Claim the next job to run, or None
+    Only one job runs at a time across all processes. A running job whose
+    heartbeat is older than stale_seconds was orphaned by a crashed worker
+    and is claimed again ahead of queued jobs, keeping its progress.
+    """
+    cutoff = f'-{int(stale_seconds)} seconds'
+    with get_db() as conn:
+        cursor = conn.cursor()
+        if not conn.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+            SELECT 1 FROM jobs WHERE status = 'running' AND heartbeat_at >= datetime('now', ?)
+        ''', (cutoff,))
+        if cursor.fetchone():
+            return None
+        
+        # Orphaned jobs that were asked to stop are simply closed
+        cursor.execute('''
+            UPDATE jobs SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP
+            WHERE status = 'running' AND cancel_requested = 1
+        ''')
+        cursor.execute('''
+            SELECT id FROM jobs WHERE status IN ('running', 'queued')
+            ORDER BY status = 'running' DESC, id LIMIT 1
+        ''')
+        row = cursor.fetchone()
+        if not row:
+            return None
+        cursor.execute('''
+            UPDATE jobs
+            SET status = 'running', worker = ?, attempts = attempts + 1,
+                started_at = COALESCE(started_at, CURRENT_TIMESTAMP), heartbeat_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (worker_id, row[0]))
+        cursor.execute('SELECT * FROM jobs WHERE id = ?', (row[0],))
+        return _job_row(cursor.fetchone())
+
+def heartbeat_job(job_id, worker_id, progress=None):
+    """
+    Record that a worker is still running a job (optionally with new progress)
+    Returns True if cancellation has been requested
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        if progress is None:
+            cursor.execute('''
+                UPDATE jobs SET heartbeat_at = CURRENT_TIMESTAMP WHERE id = ? AND worker = ?
+            ''', (job_id, worker_id))
+        else:
+            cursor.execute('''
+                UPDATE jobs SET heartbeat_at = CURRENT_TIMESTAMP, progress = ? WHERE id = ? AND worker = ?
+            ''', (json.dumps(progress), job_id, worker_id))
+        cursor.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+        return bool(row and row[0])
+
+def finish_job(job_id, status, result=None, error=None):
+    """Mark a job completed, failed or cancelled"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (status, json.dumps(result or {}), error, job_id))
+
+def request_job_cancel(job_id):
+    """
+    Ask a queued or running job to stop (queued jobs are cancelled immediately)
+    Returns False if the job doesn't exist or has already finished
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN ('queued', 'running')
+        ''', (job_id,))
+        if cursor.rowcount == 0:
+            return False
+        cursor.execute('''
+            UPDATE jobs SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'queued'
+        ''', (job_id,))
+        return True
+
+def get_job(job_id):
+    """Get a job by ID"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT j.*, u.username as created_by_username
+            FROM jobs j
+            LEFT JOIN users u ON j.created_by = u.id
+            WHERE j.id = ?
+        ''', (job_id,))
+        row = cursor.fetchone()
+        return _job_row(row) if row else None
+
+def get_jobs(limit=20, job_type=None):
+    """Get the most recent jobs"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        query = '''
+            SELECT j.*, u.username as created_by_username
+            FROM jobs j
+            LEFT JOIN users u ON j.created_by = u.id
+        '''
+        params = []
+        if job_type:
+            query += ' WHERE j.job_type = ?'
+            params.append(job_type)
+        query += ' ORDER BY j.id DESC LIMIT ?'
+        params.append(limit)
+        cursor.execute(query, params)
+        return [_job_row(row) for row in cursor.fetchall()]
+
+# ==================== ANALYTICS ROLLUPS ====================
+
+# Each rollup counter is the number of channels currently matching `condition`,
+# grouped by `keys` ({rollup column: expression over a channels row X}).
+# Empty strings stand in for NULL keys so they can be part of the primary key.
+ANALYTICS_ROLLUPS = [
+    ('channel_daily_rollup', 'fetched', {
+        'day': "COALESCE(DATE(X.fetched_at), '')",
+        'country_code': "COALESCE(X.country_code, '')",
+        'search_keyword': "COALESCE(X.search_keyword, '')",
+    }, '1'),
+    ('channel_daily_rollup', 'emailed', {
+        'day': "COALESCE(DATE(X.emailed_at), '')",
+        'country_code': "COALESCE(X.country_code, '')",
+        'search_keyword': "COALESCE(X.search_keyword, '')",
+    }, 'X.emailed = 1'),
+    ('user_daily_rollup', 'emailed', {
+        'day': "COALESCE(DATE(X.emailed_at), '')",
+        'user_id': 'X.emailed_by',
+    }, 'X.emailed = 1 AND X.emailed_by IS NOT NULL'),
+    ('user_daily_rollup', 'replied', {
+        'day': "COALESCE(DATE(X.replied_at), '')",
+        'user_id': 'X.replied_by',
+    }, 'X.reply_received = 1 AND X.replied_by IS NOT NULL'),
+]
+
+# channels columns the rollups depend on
+ROLLUP_SOURCE_COLUMNS = ['fetched_at', 'country_code', 'search_keyword', 'emailed', 'emailed_at',
+                         'emailed_by', 'reply_received', 'replied_at', 'replied_by']
+
+def _rollup_add_sql(row):
+    """SQL adding a channels row (NEW or OLD) to every rollup it counts towards"""
+    statements = []
+    for table, counter, keys, condition in ANALYTICS_ROLLUPS:
+        columns = ', '.join(keys)
+        values = ', '.join(expr.replace('X.', f'{row}.') for expr in keys.values())
+        statements.append(f'''
+                    INSERT INTO {table} ({columns}, {counter})
+                    SELECT {values}, 1 WHERE {condition.replace('X.', f'{row}.')}
+                    ON CONFLICT({columns}) DO UPDATE SET {counter} = {counter} + 1;''')
+    return ''.join(statements)
+
+def _rollup_remove_sql(row):
+    """SQL removing a channels row (NEW or OLD) from every rollup it counted towards"""
+    statements = []
+    for table, counter, keys, condition in ANALYTICS_ROLLUPS:
+        match = ' AND '.join(f"{column} = {expr.replace('X.', f'{row}.')}" for column, expr in keys.items())
+        statements.append(f'''
+                    UPDATE {table} SET {counter} = {counter} - 1
+                    WHERE {match} AND {condition.replace('X.', f'{row}.')};''')
+    return ''.join(statements)
+
+def create_rollup_triggers(cursor):
+    """Create the triggers that keep the analytics rollups in step with channels"""
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_channels_insert AFTER INSERT ON channels
+        BEGIN{_rollup_add_sql('NEW')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_channels_delete AFTER DELETE ON channels
+        BEGIN{_rollup_remove_sql('OLD')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_channels_update
+        AFTER UPDATE OF {', '.join(ROLLUP_SOURCE_COLUMNS)} ON channels
+        BEGIN{_rollup_remove_sql('OLD')}{_rollup_add_sql('NEW')}
+        END
+    ''')
+
+def rebuild_analytics_rollups(cursor):
+    """Recompute every analytics rollup from the channels table (backfill)"""
+    for table in sorted({table for table, _, _, _ in ANALYTICS_ROLLUPS}):
+        cursor.execute(f'DELETE FROM {table}')
+    for table, counter, keys, condition in ANALYTICS_ROLLUPS:
+        columns = ', '.join(keys)
+        values = ', '.join(expr.replace('X.', '') for expr in keys.values())
+        cursor.execute(f'''
+            INSERT INTO {table} ({columns}, {counter})
+            SELECT {values}, COUNT(*) FROM channels
+            WHERE {condition.replace('X.', '')}
+            GROUP BY {values}
+            ON CONFLICT({columns}) DO UPDATE SET {counter} = excluded.{counter}
+        ''')
+
 def get_analytics_data():
-    """Get analytics data for dashboard"""
+    """Get analytics data for dashboard (read from the daily rollup tables)"""
     with get_db() as conn:
         cursor = conn.cursor()
         
         # Daily stats for last 30 days
         cursor.execute('''
-            SELECT DATE(fetched_at) as date, COUNT(*) as count
-            FROM channels
-            WHERE fetched_at >= datetime('now', '-30 days')
-            GROUP BY DATE(fetched_at)
+            SELECT day as date, SUM(fetched) as count
+            FROM channel_daily_rollup
+            WHERE day >= DATE('now', '-30 days')
+            GROUP BY day
+            HAVING count > 0
             ORDER BY date DESC
         ''')
         daily_fetched = [dict(row) for row in cursor.fetchall()]
         
         # Daily emailed stats
         cursor.execute('''
-            SELECT DATE(emailed_at) as date, COUNT(*) as count
-            FROM channels
-            WHERE emailed_at >= datetime('now', '-30 days')
-            AND emailed = 1
-            GROUP BY DATE(emailed_at)
+            SELECT day as date, SUM(emailed) as count
+            FROM channel_daily_rollup
+            WHERE day >= DATE('now', '-30 days')
+            GROUP BY day
+            HAVING count > 0
             ORDER BY date DESC
         ''')
         daily_emailed = [dict(row) for row in cursor.fetchall()]
         
         # Channels by country
         cursor.execute('''
-            SELECT country_code, COUNT(*) as count
-            FROM channels
+            SELECT NULLIF(country_code, '') as country_code, SUM(fetched) as count
+            FROM channel_daily_rollup
             GROUP BY country_code
+            HAVING count > 0
             ORDER BY count DESC
         ''')
         by_country = [dict(row) for row in cursor.fetchall()]
         
         # Channels by keyword
         cursor.execute('''
-            SELECT search_keyword, COUNT(*) as count
-            FROM channels
-            WHERE search_keyword IS NOT NULL
+            SELECT search_keyword, SUM(fetched) as count
+            FROM channel_daily_rollup
+            WHERE search_keyword != ''
             GROUP BY search_keyword
+            HAVING count > 0
             ORDER BY count DESC
             LIMIT 10
         ''')
@@ -601,11 +1874,11 @@ def get_analytics_data():
         
         # User performance
         cursor.execute('''
-            SELECT u.username, COUNT(c.id) as channels_emailed
-            FROM users u
-            LEFT JOIN channels c ON u.id = c.emailed_by
-            WHERE c.emailed = 1
+            SELECT u.username, SUM(r.emailed) as channels_emailed
+            FROM user_daily_rollup r
+            JOIN users u ON u.id = r.user_id
             GROUP BY u.id, u.username
+            HAVING channels_emailed > 0
             ORDER BY channels_emailed DESC
         ''')
         user_performance = [dict(row) for row in cursor.fetchall()]
@@ -618,3 +1891,34 @@ def get_analytics_data():
             'user_performance': user_performance
         }
 
+
+if __name__ == '__main__':
+    import sys
+    import tempfile
+    
+    if sys.argv[1:2] == ['check-plans']:
+        # Regression check: build a fresh schema and make sure no dashboard query full-scans channels
+        DB_NAME = os.path.join(tempfile.mkdtemp(), 'query_plan_check.db')
+        init_db()
+        problems = check_channel_query_plans()
+        for name, plan in problems:
+            print(f"❌ Full table scan: {name}")
+            for line in plan:
+                print(f"   {line}")
+        if problems:
+            sys.exit(1)
+        print(f"✅ All {len(QUERY_PLAN_CASES)} dashboard queries use indexes")
+    elif sys.argv[1:2] == ['init']:
+        # Create/migrate the schema and run the one-off startup work
+        init_db()
+    elif sys.argv[1:2] == ['backfill-rollups']:
+        # Recompute the analytics rollups from the full channel history
+        with get_db() as conn:
+            rebuild_analytics_rollups(conn.cursor())
+        print("✅ Rebuilt analytics rollups")
+    elif sys.argv[1:2] == ['archive-activity']:
+        # Archive activity older than the given number of days (default ACTIVITY_RETENTION_DAYS)
+        days = float(sys.argv[2]) if len(sys.argv) > 2 else None
+        print(f"✅ Archived {archive_activity_log(days)} activity log entries")
+    else:
+        print("Usage: python database.py check-plans | init | backfill-rollups | archive-activity [days]")
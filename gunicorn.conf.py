@@ -0,0 +1,16 @@
+# Gunicorn settings (loaded automatically from the working directory)
+# Threaded workers so requests waiting on the YouTube API (e.g. /api/analyze)
+# don't block a whole worker process
+import os
+
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+
+def on_starting(server):
+    """Run database setup (migrations, backfills, rescoring) once, before workers are forked"""
+    from database import init_db, close_db
+    init_db()
+    # Workers open their own connections - don't carry this one across fork
+    close_db()
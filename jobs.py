@@ -0,0 +1,150 @@
+# Background job runner
+# Jobs are queued in the SQLite jobs table (see database.py) and run one at a
+# time by a daemon thread in each web process. A running job heartbeats every
+# JOB_HEARTBEAT_SECONDS; if its process dies, another runner picks it up again
+# once the heartbeat is JOB_STALE_SECONDS old, with the progress it last saved.
+import os
+import socket
+import threading
+import traceback
+import uuid
+
+from database import create_job, claim_job, heartbeat_job, finish_job, log_activity
+from youtube_fetcher import fetch_new_channels, QuotaExceededError
+
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 2))
+JOB_HEARTBEAT_SECONDS = float(os.environ.get('JOB_HEARTBEAT_SECONDS', 10))
+JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', 120))
+
+FETCH_CHANNELS_JOB = 'fetch_channels'
+
+class JobContext:
+    """What a job handler sees: its params, saved progress, and cancellation"""
+
+    def __init__(self, job, worker_id):
+        self.job_id = job['id']
+        self.job_type = job['job_type']
+        self.params = job['params']
+        self.progress = job['progress']  # non-empty when resuming after a crash
+        self.user_id = job['created_by']
+        self.worker_id = worker_id
+        self._cancel = threading.Event()
+
+    def report(self, progress):
+        """Save progress (and pick up any cancellation request)"""
+        self.progress = progress
+        if heartbeat_job(self.job_id, self.worker_id, progress):
+            self._cancel.set()
+
+    def heartbeat(self):
+        if heartbeat_job(self.job_id, self.worker_id):
+            self._cancel.set()
+
+    def cancelled(self):
+        return self._cancel.is_set()
+
+def run_fetch_job(ctx):
+    """Run a channel sweep, continuing from the saved progress if it was interrupted"""
+    params = ctx.params
+    target_channels = params.get('target_channels', 100)
+    done = ctx.progress.get('new_channels', 0)
+    skipped_before = ctx.progress.get('skipped', 0)
+
+    def progress(p):
+        ctx.report({
+            'pairs_done': p['pairs_done'],
+            'pairs_total': p['pairs_total'],
+            'new_channels': done + p['new_channels'],
+            'skipped': skipped_before + p['skipped'],
+            'target_channels': target_channels
+        })
+
+    result = {'new_channels': 0, 'total_fetched': 0, 'skipped': 0,
+              'quota_exhausted': False, 'cancelled': False}
+    if done < target_channels:
+        result = fetch_new_channels(max_results=params.get('max_results', 50),
+                                    target_channels=target_channels - done,
+                                    user_id=ctx.user_id,
+                                    progress_callback=progress,
+                                    should_cancel=ctx.cancelled)
+    result['new_channels'] += done
+    result['skipped'] += skipped_before
+    result['target_reached'] = result['new_channels'] >= target_channels
+
+    log_activity(ctx.user_id, 'fetch_channels', 'job', ctx.job_id,
+                f'Fetched {result["new_channels"]} new channels')
+    return result
+
+JOB_HANDLERS = {
+    FETCH_CHANNELS_JOB: run_fetch_job,
+}
+
+class JobRunner:
+    """Claims queued jobs and runs them on a worker thread, one at a time"""
+
+    def __init__(self):
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._thread = None
+        self._stop = threading.Event()
+        self._active = None  # (JobContext, thread) of the running job
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._loop, name='job-runner', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        interval = JOB_POLL_SECONDS
+        while not self._stop.wait(interval):
+            try:
+                if self._active and self._active[1].is_alive():
+                    self._active[0].heartbeat()
+                    interval = JOB_HEARTBEAT_SECONDS
+                    continue
+                self._active = None
+                interval = JOB_POLL_SECONDS
+                job = claim_job(self.worker_id, JOB_STALE_SECONDS)
+                if job:
+                    self._start_job(job)
+                    interval = JOB_HEARTBEAT_SECONDS
+            except Exception as e:
+                print(f"⚠️  Job runner error: {e}")
+
+    def _start_job(self, job):
+        ctx = JobContext(job, self.worker_id)
+        thread = threading.Thread(target=self._run, args=(ctx,), name=f'job-{ctx.job_id}', daemon=True)
+        self._active = (ctx, thread)
+        thread.start()
+
+    def _run(self, ctx):
+        handler = JOB_HANDLERS.get(ctx.job_type)
+        if handler is None:
+            finish_job(ctx.job_id, 'failed', error=f'Unknown job type: {ctx.job_type}')
+            return
+        print(f"▶️  Running job {ctx.job_id} ({ctx.job_type})")
+        try:
+            result = handler(ctx)
+            finish_job(ctx.job_id, 'cancelled' if ctx.cancelled() else 'completed', result)
+        except QuotaExceededError as e:
+            finish_job(ctx.job_id, 'failed', error=str(e))
+        except Exception as e:
+            traceback.print_exc()
+            finish_job(ctx.job_id, 'failed', error=str(e))
+        print(f"⏹️  Finished job {ctx.job_id}")
+
+JOB_RUNNER = JobRunner()
+
+def start_job_runner():
+    """Start this process's job runner (set JOB_RUNNER_ENABLED=false to only queue jobs)"""
+    if os.environ.get('JOB_RUNNER_ENABLED', 'true').lower() in ('false', '0', 'no'):
+        return
+    JOB_RUNNER.start()
+
+def queue_fetch_job(max_results=50, target_channels=100, user_id=None):
+    """Queue a channel sweep, returns the job ID"""
+    return create_job(FETCH_CHANNELS_JOB, {'max_results': max_results, 'target_channels': target_channels},
+                      user_id)
@@ -0,0 +1,68 @@
+"""
+Priority scoring formulas and a vectorized batch scoring engine.
+
+A formula is a versioned weight set. Each component scores
+min(cap, metric / per_point), and the priority score is their sum:
+- subscribers: subscriber count
+- engagement:  views per subscriber (0 when there are no subscribers)
+- activity:    video count
+"""
+import numpy as np
+import pandas as pd
+import os
+
+SCORING_FORMULAS = {
+    1: {
+        'subscribers': {'cap': 40, 'per_point': 2500},   # 100k subs = 40 points
+        'engagement': {'cap': 30, 'per_point': 10},      # 100 views/sub = 30 points
+        'activity': {'cap': 30, 'per_point': 10},        # 300 videos = 30 points
+    },
+}
+
+# Formula used for stored scores (override with SCORE_FORMULA_VERSION)
+CURRENT_FORMULA_VERSION = int(os.environ.get('SCORE_FORMULA_VERSION', max(SCORING_FORMULAS)))
+
+def get_weights(version=None, weights=None):
+    """Resolve a weight set: explicit weights win, otherwise a formula version"""
+    if weights is not None:
+        return weights
+    version = CURRENT_FORMULA_VERSION if version is None else version
+    if version not in SCORING_FORMULAS:
+        raise ValueError(f"Unknown scoring formula version: {version}")
+    return SCORING_FORMULAS[version]
+
+def to_count_array(values):
+    """Convert a column (ints, numeric TEXT, None) to a float array of whole counts"""
+    numbers = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce')
+    return np.trunc(numbers.fillna(0).to_numpy(dtype=float))
+
+def score_arrays(subscribers, views, videos, version=None, weights=None):
+    """Compute priority scores for whole columns at once"""
+    w = get_weights(version, weights)
+    subs = to_count_array(subscribers)
+    views = to_count_array(views)
+    videos = to_count_array(videos)
+    
+    sub_score = np.minimum(w['subscribers']['cap'], subs / w['subscribers']['per_point'])
+    engagement = np.divide(views, subs, out=np.zeros_like(views), where=subs > 0)
+    engagement_score = np.minimum(w['engagement']['cap'], engagement / w['engagement']['per_point'])
+    activity_score = np.minimum(w['activity']['cap'], videos / w['activity']['per_point'])
+    
+    return np.round(sub_score + engagement_score + activity_score, 2)
+
+def score_frame(df, version=None, weights=None):
+    """Score a DataFrame with subscribers, total_views and video_count columns"""
+    scores = score_arrays(df['subscribers'], df['total_views'], df['video_count'],
+                          version=version, weights=weights)
+    return pd.Series(scores, index=df.index, name='priority_score')
+
+def score_values(subscribers, views, videos, version=None, weights=None):
+    """Score a single channel (plain Python, for the per-channel ingest path)"""
+    w = get_weights(version, weights)
+    sub_score = min(w['subscribers']['cap'], subscribers / w['subscribers']['per_point'])
+    if subscribers > 0:
+        engagement_score = min(w['engagement']['cap'], views / subscribers / w['engagement']['per_point'])
+    else:
+        engagement_score = 0
+    activity_score = min(w['activity']['cap'], videos / w['activity']['per_point'])
+    return round(sub_score + engagement_score + activity_score, 2)
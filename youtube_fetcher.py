@@ -1,5 +1,17 @@
 from googleapiclient.discovery import build
-from database import channel_exists, add_channel, get_fetched_channel_ids, log_activity, calculate_priority_score
+from googleapiclient.errors import HttpError
+from database import (
+    channel_exists, add_channels, get_fetched_channel_ids, log_activity, calculate_priority_score,
+    reserve_api_quota, get_api_quota_usage, mark_api_quota_exhausted,
+    get_cached_response, set_cached_response, evict_cached_responses, get_cache_entry_counts,
+    get_handle_resolution, save_handle_resolution, get_sweep_checkpoints, save_sweep_checkpoint
+)
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+import threading
+import copy
+import json
 import time
 import re
 import os
@@ -13,6 +25,53 @@ if not API_KEY:
     raise ValueError("YOUTUBE_API_KEY environment variable is required. Please set it before running the application.")
 YOUTUBE = build("youtube", "v3", developerKey=API_KEY)
 
+# ⚙️ Concurrency settings for fetch_new_channels
+# Number of (country, keyword) pairs searched in parallel
+FETCH_WORKERS = int(os.environ.get('FETCH_WORKERS', 8))
+# Shared API rate limit (requests per second) and burst size for all workers
+API_RATE_PER_SECOND = float(os.environ.get('YOUTUBE_API_RATE', 10))
+API_RATE_BURST = int(os.environ.get('YOUTUBE_API_BURST', 10))
+
+# 💰 Daily API quota (units per day, resets at midnight Pacific time)
+DAILY_QUOTA = int(os.environ.get('YOUTUBE_DAILY_QUOTA', 10000))
+# Units kept back for the public analyzer - batch sweeps can never spend them
+INTERACTIVE_RESERVE = int(os.environ.get('YOUTUBE_INTERACTIVE_RESERVE', 1000))
+# Unit cost of each endpoint we use
+API_COSTS = {
+    'search': 100,   # search().list
+    'channels': 1,   # channels().list
+}
+# Call priorities: /api/analyze traffic is interactive, /api/fetch sweeps and
+# /api/analyze/batch are batch
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_BATCH = 'batch'
+
+# 🗄️ API response cache - TTL (seconds) per resource type
+CACHE_TTLS = {
+    'handle': int(os.environ.get('CACHE_TTL_HANDLE', 30 * 24 * 3600)),    # handle → ID almost never changes
+    'channels': int(os.environ.get('CACHE_TTL_CHANNELS', 6 * 3600)),     # statistics go stale in hours
+    'search': int(os.environ.get('CACHE_TTL_SEARCH', 24 * 3600)),        # search results last a day
+}
+# Least recently used responses beyond this are evicted
+API_CACHE_MAX_ENTRIES = int(os.environ.get('API_CACHE_MAX_ENTRIES', 50000))
+# How long a handle that didn't resolve is remembered as not existing (seconds)
+HANDLE_NEGATIVE_TTL = int(os.environ.get('HANDLE_NEGATIVE_TTL', 24 * 3600))
+# Handles not yet in the index that one analyze_channels call may look up
+MAX_BATCH_HANDLE_LOOKUPS = int(os.environ.get('MAX_BATCH_HANDLE_LOOKUPS', 25))
+
+# 🔁 Sweep checkpoints - a (country, keyword, order) search done within this
+# many hours is skipped by fetch_new_channels, it would only return channels we have
+SWEEP_FRESHNESS_HOURS = float(os.environ.get('SWEEP_FRESHNESS_HOURS', 72))
+# Search orders a sweep rotates between for diversity
+SEARCH_ORDERS = ['relevance', 'date', 'viewCount']
+
+# 📄 Deep search - search().list returns at most 50 results per page
+SEARCH_PAGE_SIZE = 50
+# A sweep follows nextPageToken for up to this many pages per search...
+SEARCH_MAX_PAGES = int(os.environ.get('SEARCH_MAX_PAGES', 5))
+# ...but only while a page is at least this fraction new channels
+SEARCH_MIN_NEW_RATIO = float(os.environ.get('SEARCH_MIN_NEW_RATIO', 0.2))
+
 # 🌎 Countries to target (Top spending/high-value markets only)
 # Optimized for quota efficiency - 6 high-value countries
 COUNTRIES = [
@@ -39,50 +98,284 @@ KEYWORDS = [
     "yoga"               # Health & Wellness
 ]
 
-def get_channels(keyword, country, max_results=50, order='relevance'):
-    """Search YouTube channels by keyword & country with different order options"""
-    search_response = YOUTUBE.search().list(
-        q=keyword,
-        type="channel",
-        part="snippet",
-        regionCode=country,
-        maxResults=max_results,
-        order=order  # 'relevance', 'date', 'rating', 'viewCount', 'title'
-    ).execute()
-    return [item["snippet"]["channelId"] for item in search_response["items"]]
-
-def get_channels_from_videos(keyword, country, max_results=100):
-    """Get channels by searching videos first (finds active channels)"""
-    try:
-        # Search for recent videos
-        video_response = YOUTUBE.search().list(
+class TokenBucket:
+    """Thread-safe token bucket rate limiter shared by all API workers"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` tokens are available, then take them"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+RATE_LIMITER = TokenBucket(API_RATE_PER_SECOND, API_RATE_BURST)
+
+_thread_local = threading.local()
+
+def get_youtube():
+    """
+    Return the YouTube client for the current thread.
+    The underlying httplib2 transport is not thread-safe, so worker threads
+    each build their own client instead of sharing YOUTUBE.
+    """
+    if threading.current_thread() is threading.main_thread():
+        return YOUTUBE
+    client = getattr(_thread_local, 'youtube', None)
+    if client is None:
+        client = build("youtube", "v3", developerKey=API_KEY, cache_discovery=False)
+        _thread_local.youtube = client
+    return client
+
+class QuotaExceededError(Exception):
+    """Raised when the daily API quota is (or would be) exhausted"""
+
+    def __init__(self, message="API quota exceeded. Please try again later."):
+        super().__init__(message)
+
+# The API quota resets at midnight Pacific time (PST or PDT)
+QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')
+
+def quota_day():
+    """Current quota day - the API quota resets at midnight Pacific time"""
+    return datetime.now(QUOTA_TIMEZONE).strftime('%Y-%m-%d')
+
+def is_quota_error(error):
+    """Check whether an API error means the daily quota is used up"""
+    if not isinstance(error, HttpError):
+        return False
+    content = error.content or b''
+    if isinstance(content, str):
+        content = content.encode()
+    return b'quotaExceeded' in content or b'dailyLimitExceeded' in content
+
+class ResponseCache:
+    """
+    Persistent cache of API responses (api_cache table), keyed by endpoint and
+    normalized parameters, with a TTL per resource type and LRU eviction
+    """
+    EVICT_EVERY = 100  # writes between eviction passes
+
+    def __init__(self, ttls=CACHE_TTLS, max_entries=API_CACHE_MAX_ENTRIES):
+        self.ttls = ttls
+        self.max_entries = max_entries
+        self.hits = {resource: 0 for resource in ttls}
+        self.misses = {resource: 0 for resource in ttls}
+        self.writes = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(endpoint, params):
+        """Build a cache key that doesn't depend on case, spacing or ID order"""
+        normalized = {}
+        for key, value in params.items():
+            if isinstance(value, str):
+                value = value.strip()
+                if key in ('q', 'forHandle', 'forUsername'):
+                    value = value.lower()
+                elif key == 'id':
+                    value = ','.join(sorted(value.split(',')))
+            normalized[key] = value
+        return f"{endpoint}:{json.dumps(normalized, sort_keys=True)}"
+
+    def get(self, resource, cache_key):
+        cached = get_cached_response(cache_key, time.time())
+        with self.lock:
+            if cached is None:
+                self.misses[resource] += 1
+            else:
+                self.hits[resource] += 1
+        return json.loads(cached) if cached is not None else None
+
+    def set(self, resource, cache_key, response):
+        now = time.time()
+        set_cached_response(cache_key, resource, json.dumps(response), now + self.ttls[resource], now)
+        with self.lock:
+            self.writes += 1
+            evict = self.writes % self.EVICT_EVERY == 0
+        if evict:
+            evict_cached_responses(self.max_entries, now)
+
+    def stats(self):
+        entries = get_cache_entry_counts()
+        with self.lock:
+            return {
+                resource: {
+                    'hits': self.hits[resource],
+                    'misses': self.misses[resource],
+                    'entries': entries.get(resource, 0),
+                    'ttl_seconds': ttl,
+                }
+                for resource, ttl in self.ttls.items()
+            }
+
+RESPONSE_CACHE = ResponseCache()
+
+def get_cache_stats():
+    """API response cache hit/miss counters (this process) and entry counts"""
+    return RESPONSE_CACHE.stats()
+
+class QuotaScheduler:
+    """
+    Central gate for every YouTube API call.
+    Charges the known unit cost of each call against a daily budget persisted
+    in the database before the call is made, so work is refused up front
+    instead of failing halfway. Batch calls can only spend up to
+    DAILY_QUOTA - INTERACTIVE_RESERVE and go through RATE_LIMITER, so a big
+    sweep can't starve the analyzer. Calls made with a `cache` resource type
+    are answered from RESPONSE_CACHE when possible and cost nothing.
+    """
+
+    def __init__(self, daily_quota=DAILY_QUOTA, interactive_reserve=INTERACTIVE_RESERVE, cache=RESPONSE_CACHE):
+        self.daily_quota = daily_quota
+        self.interactive_reserve = interactive_reserve
+        self.cache = cache
+
+    def limit(self, priority=PRIORITY_BATCH):
+        """Highest daily usage a call of this priority may bring us to"""
+        if priority == PRIORITY_INTERACTIVE:
+            return self.daily_quota
+        return max(0, self.daily_quota - self.interactive_reserve)
+
+    def remaining(self, priority=PRIORITY_BATCH):
+        """Units still available today for calls of this priority"""
+        return max(0, self.limit(priority) - get_api_quota_usage(quota_day()))
+
+    def can_afford(self, units, priority=PRIORITY_BATCH):
+        return self.remaining(priority) >= units
+
+    def execute(self, endpoint, priority=PRIORITY_BATCH, cache=None, **params):
+        """Charge the endpoint's cost and run `<endpoint>().list(**params)`"""
+        if cache:
+            cache_key = self.cache.make_key(endpoint, params)
+            cached = self.cache.get(cache, cache_key)
+            if cached is not None:
+                return cached
+        
+        day = quota_day()
+        if not reserve_api_quota(day, API_COSTS[endpoint], self.limit(priority)):
+            raise QuotaExceededError()
+        if priority == PRIORITY_BATCH:
+            RATE_LIMITER.acquire()
+        resource = getattr(get_youtube(), endpoint)()
+        try:
+            response = resource.list(**params).execute()
+        except HttpError as e:
+            if is_quota_error(e):
+                # Our count drifted from Google's - stop everyone for the rest of the day
+                mark_api_quota_exhausted(day, self.daily_quota)
+                raise QuotaExceededError()
+            raise
+        
+        # Empty results aren't cached so a new channel or handle shows up right away
+        if cache and response.get('items'):
+            self.cache.set(cache, cache_key, response)
+        return response
+
+SCHEDULER = QuotaScheduler()
+
+def get_quota_status():
+    """Today's API quota usage for the admin dashboard"""
+    used = get_api_quota_usage(quota_day())
+    return {
+        'day': quota_day(),
+        'used': used,
+        'daily_quota': SCHEDULER.daily_quota,
+        'interactive_reserve': SCHEDULER.interactive_reserve,
+        'remaining': max(0, SCHEDULER.daily_quota - used),
+        'remaining_batch': SCHEDULER.remaining(PRIORITY_BATCH),
+    }
+
+def search_pages(keyword, country, search_type='channel', order='relevance', max_results=SEARCH_PAGE_SIZE,
+                 page_token=None, max_pages=None, priority=PRIORITY_BATCH):
+    """
+    Lazily page through search results for a keyword & country
+    Yields (page_token, channel_ids, next_page_token) for each page; the next
+    page is only requested (and charged) when the caller asks for it.
+    Stops after the last page or max_pages pages.
+    """
+    pages = 0
+    while True:
+        params = dict(
             q=keyword,
-            type="video",
+            type=search_type,
             part="snippet",
             regionCode=country,
-            maxResults=max_results,
-            order='date'  # Get recent videos to find active channels
-        ).execute()
-        
-        # Extract unique channel IDs from videos
-        channel_ids = list(set([
-            item["snippet"]["channelId"] 
-            for item in video_response.get("items", [])
-        ]))
+            maxResults=min(max_results, SEARCH_PAGE_SIZE),
+            order=order  # 'relevance', 'date', 'rating', 'viewCount', 'title'
+        )
+        if page_token:
+            params['pageToken'] = page_token
+        search_response = SCHEDULER.execute('search', priority=priority, cache='search', **params)
+        next_page_token = search_response.get('nextPageToken')
+        channel_ids = list(dict.fromkeys(item["snippet"]["channelId"] for item in search_response.get("items", [])))
+        yield page_token or '', channel_ids, next_page_token
         
+        pages += 1
+        if not next_page_token or (max_pages and pages >= max_pages):
+            return
+        page_token = next_page_token
+
+def resume_search_pages(keyword, country, order='relevance', page_token=None, **kwargs):
+    """
+    search_pages for channels starting at a saved page token
+    Starts over from the first page if the API rejects the token (e.g. it expired).
+    """
+    if page_token:
+        pages = search_pages(keyword, country, 'channel', order, page_token=page_token, **kwargs)
+        try:
+            first = next(pages)
+        except HttpError as e:
+            print(f"⚠️  Saved page token for '{keyword}' ({country}, {order}) failed ({e}), starting from page 1")
+        else:
+            yield first
+            yield from pages
+            return
+    yield from search_pages(keyword, country, 'channel', order, **kwargs)
+
+def get_channels(keyword, country, max_results=50, order='relevance', priority=PRIORITY_BATCH, page_token=None):
+    """Search YouTube channels by keyword & country with different order options (one page)"""
+    for _, channel_ids, _ in search_pages(keyword, country, 'channel', order, max_results, page_token,
+                                          max_pages=1, priority=priority):
         return channel_ids
+    return []
+
+def get_channels_from_videos(keyword, country, max_results=50, priority=PRIORITY_BATCH):
+    """Get channels by searching videos first (finds active channels)"""
+    try:
+        # Search for recent videos (order='date') and collect their unique channel IDs
+        for _, channel_ids, _ in search_pages(keyword, country, 'video', 'date', max_results,
+                                              max_pages=1, priority=priority):
+            return channel_ids
+        return []
+    except QuotaExceededError:
+        raise
     except Exception as e:
         print(f"   ⚠️  Error in video search: {e}")
         return []
 
-def get_channel_details(channel_ids, max_subscribers=100000):
+def get_channel_details(channel_ids, max_subscribers=100000, priority=PRIORITY_BATCH):
     """Fetch detailed info for given channel IDs with subscriber filter"""
     channel_data = []
     for i in range(0, len(channel_ids), 50):  # 50 per API call limit
-        response = YOUTUBE.channels().list(
+        response = SCHEDULER.execute(
+            'channels',
+            priority=priority,
             part="snippet,statistics,brandingSettings,topicDetails",
             id=",".join(channel_ids[i:i+50])
-        ).execute()
+        )
 
         for item in response.get("items", []):
             snippet = item.get("snippet", {})
@@ -112,11 +405,66 @@ def get_channel_details(channel_ids, max_subscribers=100000):
 
             channel_data.append(channel_info)
 
-        time.sleep(1)  # polite delay
-
     return channel_data
 
-def extract_channel_id(url_or_id):
+class ChannelBatcher:
+    """
+    Coalesces channel IDs found by many searches into full 50-ID
+    channels().list requests, remembering which search page found each ID and
+    how many of each page's IDs haven't been stored yet
+    """
+
+    def __init__(self, batch_size=50):
+        self.batch_size = batch_size
+        self.pending = []
+        self.origins = {}      # channel ID -> (country, keyword, order, page_token) of the page that found it
+        self.outstanding = {}  # (country, keyword, order, page_token) -> its IDs not yet settled
+        self.lock = threading.Lock()
+
+    def add(self, channel_ids, keyword, country, order=None, page_token=''):
+        """Queue IDs from one search page; returns the batches that are now full"""
+        with self.lock:
+            page = (country, keyword, order, page_token)
+            for channel_id in channel_ids:
+                if channel_id not in self.origins:
+                    self.origins[channel_id] = page
+                    self.pending.append(channel_id)
+                    self.outstanding[page] = self.outstanding.get(page, 0) + 1
+            return self._take(full_only=True)
+
+    def drain(self):
+        """Return every queued ID as batches, including a final partial batch"""
+        with self.lock:
+            return self._take(full_only=False)
+
+    def settle(self, channel_ids):
+        """Mark IDs whose fetched details have been stored"""
+        with self.lock:
+            for channel_id in channel_ids:
+                self.outstanding[self.origins[channel_id]] -= 1
+
+    def unsettled(self, country, keyword, order=None, page_token=''):
+        """Number of IDs found by a search page whose details haven't been stored yet"""
+        with self.lock:
+            return self.outstanding.get((country, keyword, order, page_token), 0)
+
+    def _take(self, full_only):
+        batches = []
+        while len(self.pending) >= self.batch_size or (self.pending and not full_only):
+            batches.append(self.pending[:self.batch_size])
+            del self.pending[:self.batch_size]
+        return batches
+
+    def fetch(self, batch, max_subscribers=100000):
+        """Fetch details for one batch and tag each channel with its search origin"""
+        data = get_channel_details(batch, max_subscribers=max_subscribers)
+        for d in data:
+            country, keyword, _, _ = self.origins[d["Channel ID"]]
+            d["Search Keyword"] = keyword
+            d["Country Code"] = country
+        return data
+
+def extract_channel_id(url_or_id, priority=PRIORITY_INTERACTIVE, allow_search=True):
     """
     Extract YouTube channel ID from various URL formats or return ID if already provided
     Supports:
@@ -126,12 +474,22 @@ def extract_channel_id(url_or_id):
     - youtube.com/user/username
     - Direct channel ID: UCxxxxx
     """
+    channel_id, username = parse_channel_input(url_or_id)
+    if username:
+        return resolve_username_to_channel_id(username, priority=priority, allow_search=allow_search)
+    return channel_id
+
+def parse_channel_input(url_or_id):
+    """
+    Split a channel URL or ID into (channel_id, username) without calling the API
+    Exactly one of them is set when the input is recognised, neither otherwise.
+    """
     if not url_or_id:
-        return None
+        return None, None
     
     # If it's already a channel ID (starts with UC)
     if re.match(r'^UC[a-zA-Z0-9_-]{22}$', url_or_id):
-        return url_or_id
+        return url_or_id, None
     
     # Extract from various URL formats (handle www. and without)
     patterns = [
@@ -147,264 +505,655 @@ def extract_channel_id(url_or_id):
             channel_identifier = match.group(1)
             # If it's a channel ID (starts with UC), return it
             if channel_identifier.startswith('UC') and len(channel_identifier) == 24:
-                return channel_identifier
+                return channel_identifier, None
             # Otherwise, it's a username - need to resolve it
             if channel_identifier.startswith('@'):
                 channel_identifier = channel_identifier[1:]
-            return resolve_username_to_channel_id(channel_identifier)
+            return None, channel_identifier
     
-    return None
+    return None, None
 
-def resolve_username_to_channel_id(username):
-    """Resolve YouTube username/handle to channel ID"""
+def resolve_username_to_channel_id(username, priority=PRIORITY_INTERACTIVE, allow_search=True):
+    """
+    Resolve YouTube username/handle to channel ID
+    Checks the channel_handles index first and only calls the API on a miss.
+    Exact answers from the API (including "not found") are recorded in the
+    index; guesses and lookups that hit an API error are not.
+    allow_search=False skips the 100-unit search fallback.
+    """
+    # Remove @ if present
+    if username.startswith('@'):
+        username = username[1:]
+    
+    found, channel_id = get_handle_resolution(username, negative_ttl_seconds=HANDLE_NEGATIVE_TTL)
+    if found:
+        return channel_id
+    
+    channel_id, exact = _resolve_username_via_api(username, priority=priority, allow_search=allow_search)
+    if exact:
+        save_handle_resolution(username, channel_id, 'api')
+    return channel_id
+
+def _resolve_username_via_api(username, priority=PRIORITY_INTERACTIVE, allow_search=True):
+    """
+    Resolve a username/handle (without @) to a channel ID using up to three API calls
+    Returns (channel_id, exact): exact is True when the API answered definitively -
+    a handle/username/customUrl match, or no match from every method without
+    errors - and False for a closest-result guess, when a method failed or
+    when the search method was skipped.
+    """
+    failed = not allow_search
+    guess = None
     try:
-        # Remove @ if present
-        if username.startswith('@'):
-            username = username[1:]
-        
         # Method 1: Try to get channel by handle using channels().list with forHandle
         # This is the most direct method for @username format (uses less quota)
         try:
-            response = YOUTUBE.channels().list(
+            response = SCHEDULER.execute(
+                'channels',
+                priority=priority,
+                cache='handle',
                 part="id",
                 forHandle=username,
                 maxResults=1
-            ).execute()
+            )
             
             if response.get('items'):
-                return response['items'][0]['id']
-        except Exception as e1:
-            # Check if it's a quota error - if so, don't try other methods
-            error_str = str(e1)
-            if 'quota' in error_str.lower() or 'quotaExceeded' in error_str:
-                print(f"API quota exceeded. Cannot resolve username: {username}")
-                raise Exception("API quota exceeded")
+                return response['items'][0]['id'], True
+        except QuotaExceededError:
+            # Quota is gone - don't try other methods
+            print(f"API quota exceeded. Cannot resolve username: {username}")
+            raise
+        except Exception:
             # If forHandle doesn't work (maybe not available), try other methods
-            pass
+            failed = True
         
         # Method 2: Try searching for the handle (uses more quota)
         # Only try this if forHandle didn't work and quota is available
-        try:
-            response = YOUTUBE.search().list(
-                q=f"@{username}",
-                type="channel",
-                part="snippet",
-                maxResults=10
-            ).execute()
+        if allow_search:
+            try:
+                response = SCHEDULER.execute(
+                    'search',
+                    priority=priority,
+                    cache='handle',
+                    q=f"@{username}",
+                    type="channel",
+                    part="snippet",
+                    maxResults=10
+                )
             
-            # Find exact match by checking customUrl
-            for item in response.get('items', []):
-                snippet = item.get('snippet', {})
-                custom_url = snippet.get('customUrl', '')
-                channel_id = snippet.get('channelId', '')
+                # Find exact match by checking customUrl
+                clean_username = username.lower()
+                for item in response.get('items', []):
+                    snippet = item.get('snippet', {})
+                    custom_url = snippet.get('customUrl', '')
+                    channel_id = snippet.get('channelId', '')
                 
-                # Check if custom URL exactly matches (with or without @)
-                if custom_url:
-                    # Remove @ and compare
-                    clean_custom = custom_url.replace('@', '').lower()
-                    clean_username = username.lower()
-                    if clean_custom == clean_username or f"@{clean_custom}" == f"@{clean_username}":
-                        return channel_id
+                    # Check if custom URL exactly matches (with or without @)
+                    if custom_url and custom_url.replace('@', '').lower() == clean_username:
+                        return channel_id, True
                 
-                # Also check if the channel title matches closely
-                channel_title = snippet.get('title', '').lower()
-                if username.lower() in channel_title:
-                    return channel_id
+                    # Otherwise remember the first channel whose title matches closely
+                    if guess is None and clean_username in snippet.get('title', '').lower():
+                        guess = channel_id
             
-            # If no exact match, return first result as fallback
-            if response.get('items'):
-                return response['items'][0]['snippet']['channelId']
-        except Exception as e2:
-            error_str = str(e2)
-            if 'quota' in error_str.lower() or 'quotaExceeded' in error_str:
+                # If no exact match, fall back to the first result (a guess - not recorded)
+                if guess is None and response.get('items'):
+                    guess = response['items'][0]['snippet']['channelId']
+            except QuotaExceededError:
                 print(f"API quota exceeded in search method")
-                raise Exception("API quota exceeded")
-            print(f"Error in search method: {e2}")
+                raise
+            except Exception as e2:
+                print(f"Error in search method: {e2}")
+                failed = True
         
         # Method 3: Try legacy forUsername (deprecated but might work for some)
         try:
-            response = YOUTUBE.channels().list(
+            response = SCHEDULER.execute(
+                'channels',
+                priority=priority,
+                cache='handle',
                 part="id",
                 forUsername=username,
                 maxResults=1
-            ).execute()
+            )
             
             if response.get('items'):
-                return response['items'][0]['id']
-        except Exception as e3:
-            error_str = str(e3)
-            if 'quota' in error_str.lower() or 'quotaExceeded' in error_str:
-                raise Exception("API quota exceeded")
-            pass
+                return response['items'][0]['id'], True
+        except QuotaExceededError:
+            raise
+        except Exception:
+            failed = True
             
+    except QuotaExceededError:
+        raise
     except Exception as e:
-        # Re-raise quota errors
-        if 'quota' in str(e).lower():
-            raise
         print(f"Error resolving username {username}: {e}")
+        failed = True
     
-    return None
+    if guess:
+        return guess, False
+    return None, not failed
+
+class SingleFlight:
+    """Lets concurrent callers asking for the same key share one in-flight call"""
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs), or wait for the identical call already running"""
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.calls[key] = future
+        if not leader:
+            return future.result()
+        
+        try:
+            result = fn(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+ANALYZE_FLIGHTS = SingleFlight()
+
+def normalize_channel_input(channel_url_or_id):
+    """Normalize an analyzer input so equivalent URLs map to the same key"""
+    value = channel_url_or_id.strip()
+    match = re.search(r'(UC[a-zA-Z0-9_-]{22})(?![a-zA-Z0-9_-])', value)
+    if match and '/@' not in value:
+        return match.group(1)  # channel IDs are case-sensitive
+    value = re.sub(r'^(https?://)?(www\.|m\.)?', '', value.lower())
+    return value.split('?')[0].split('#')[0].rstrip('/')
 
 def analyze_channel(channel_url_or_id):
     """
     Analyze a single YouTube channel (public API - no filters)
+    Concurrent requests for the same channel share one upstream fetch.
     Returns channel data with priority score and analysis
     """
+    result = ANALYZE_FLIGHTS.do(normalize_channel_input(channel_url_or_id),
+                                _analyze_channel, channel_url_or_id)
+    # Each caller gets its own copy of the shared result
+    return copy.deepcopy(result)
+
+ANALYZE_PARTS = "snippet,statistics,brandingSettings,topicDetails,contentDetails"
+
+def _analyze_channel(channel_url_or_id):
+    """Fetch and score a single channel (see analyze_channel)"""
     try:
         channel_id = extract_channel_id(channel_url_or_id)
         if not channel_id:
             print(f"Could not extract channel ID from: {channel_url_or_id}")
             return None
+    except QuotaExceededError:
+        raise
     except Exception as e:
-        error_str = str(e)
-        if 'quota' in error_str.lower():
-            raise Exception("API quota exceeded. Please try again later.")
         print(f"Error extracting channel ID: {e}")
         return None
     
     try:
         # Fetch channel details
-        response = YOUTUBE.channels().list(
-            part="snippet,statistics,brandingSettings,topicDetails,contentDetails",
+        response = SCHEDULER.execute(
+            'channels',
+            priority=PRIORITY_INTERACTIVE,
+            cache='channels',
+            part=ANALYZE_PARTS,
             id=channel_id
-        ).execute()
+        )
         
         if not response.get('items'):
             print(f"Channel not found for ID: {channel_id}")
             return None
         
-        item = response['items'][0]
-        snippet = item.get("snippet", {})
-        stats = item.get("statistics", {})
-        branding = item.get("brandingSettings", {})
-        
-        # Prepare channel data
-        channel_data = {
-            "Channel ID": item.get('id'),
-            "Title": snippet.get("title"),
-            "Description": snippet.get("description", "")[:500],  # Limit description
-            "Country": snippet.get("country"),
-            "Country Code": snippet.get("country"),
-            "Subscribers": int(stats.get("subscriberCount", 0) or 0),
-            "Total Views": int(stats.get("viewCount", 0) or 0),
-            "Video Count": int(stats.get("videoCount", 0) or 0),
-            "Custom URL": snippet.get("customUrl"),
-            "Keywords": branding.get("channel", {}).get("keywords"),
-            "Default Language": snippet.get("defaultLanguage"),
-            "Channel URL": f"https://www.youtube.com/channel/{item.get('id')}",
-            "Thumbnail": snippet.get("thumbnails", {}).get("high", {}).get("url", ""),
-            "Published At": snippet.get("publishedAt", ""),
-        }
-        
-        # Calculate priority score
-        channel_data["Priority Score"] = calculate_priority_score(channel_data)
-        
-        # Calculate engagement metrics
-        subs = channel_data["Subscribers"]
-        views = channel_data["Total Views"]
-        videos = channel_data["Video Count"]
-        
-        channel_data["Engagement Rate"] = round((views / subs) if subs > 0 else 0, 2)
-        channel_data["Views Per Video"] = round((views / videos) if videos > 0 else 0, 0)
-        channel_data["Subscribers Per Video"] = round((subs / videos) if videos > 0 else 0, 0)
-        
-        # Generate recommendations
-        recommendations = []
-        if channel_data["Priority Score"] < 50:
-            recommendations.append("Focus on increasing subscriber count to improve your priority score")
-        if channel_data["Engagement Rate"] < 50:
-            recommendations.append("Improve engagement by creating more compelling content")
-        if videos < 50:
-            recommendations.append("Increase video frequency to boost activity score")
-        if not recommendations:
-            recommendations.append("Your channel is performing well! Consider optimizing SEO for even better results.")
-        
-        channel_data["Recommendations"] = recommendations
+        return build_channel_analysis(response['items'][0])
         
-        return channel_data
-        
-    except Exception as e:
-        error_str = str(e)
+    except QuotaExceededError:
         # Re-raise quota errors so they can be handled properly
-        if 'quota' in error_str.lower() or 'quotaExceeded' in error_str:
-            raise Exception("API quota exceeded. Please try again later.")
+        raise
+    except Exception as e:
         print(f"Error analyzing channel: {e}")
         return None
 
-def fetch_new_channels(max_results=100, max_subscribers=100000, target_channels=100, user_id=None):
+def build_channel_analysis(item):
+    """Build analyzer output (metrics, score, recommendations) from a channels().list item"""
+    snippet = item.get("snippet", {})
+    stats = item.get("statistics", {})
+    branding = item.get("brandingSettings", {})
+    
+    # Prepare channel data
+    channel_data = {
+        "Channel ID": item.get('id'),
+        "Title": snippet.get("title"),
+        "Description": snippet.get("description", "")[:500],  # Limit description
+        "Country": snippet.get("country"),
+        "Country Code": snippet.get("country"),
+        "Subscribers": int(stats.get("subscriberCount", 0) or 0),
+        "Total Views": int(stats.get("viewCount", 0) or 0),
+        "Video Count": int(stats.get("videoCount", 0) or 0),
+        "Custom URL": snippet.get("customUrl"),
+        "Keywords": branding.get("channel", {}).get("keywords"),
+        "Default Language": snippet.get("defaultLanguage"),
+        "Channel URL": f"https://www.youtube.com/channel/{item.get('id')}",
+        "Thumbnail": snippet.get("thumbnails", {}).get("high", {}).get("url", ""),
+        "Published At": snippet.get("publishedAt", ""),
+    }
+    
+    # Calculate priority score
+    channel_data["Priority Score"] = calculate_priority_score(channel_data)
+    
+    # Calculate engagement metrics
+    subs = channel_data["Subscribers"]
+    views = channel_data["Total Views"]
+    videos = channel_data["Video Count"]
+    
+    channel_data["Engagement Rate"] = round((views / subs) if subs > 0 else 0, 2)
+    channel_data["Views Per Video"] = round((views / videos) if videos > 0 else 0, 0)
+    channel_data["Subscribers Per Video"] = round((subs / videos) if videos > 0 else 0, 0)
+    
+    # Generate recommendations
+    recommendations = []
+    if channel_data["Priority Score"] < 50:
+        recommendations.append("Focus on increasing subscriber count to improve your priority score")
+    if channel_data["Engagement Rate"] < 50:
+        recommendations.append("Improve engagement by creating more compelling content")
+    if videos < 50:
+        recommendations.append("Increase video frequency to boost activity score")
+    if not recommendations:
+        recommendations.append("Your channel is performing well! Consider optimizing SEO for even better results.")
+    
+    channel_data["Recommendations"] = recommendations
+    
+    return channel_data
+
+def analyze_channels(channel_urls):
+    """
+    Analyze many channels at once (public API - no filters)
+    Inputs are resolved to channel IDs first, then the unique IDs are fetched
+    in 50-ID channels().list calls instead of one call per channel.
+    All calls are charged at batch priority so this endpoint can't spend the
+    interactive reserve; handles missing from the index are resolved without
+    the search fallback, and at most MAX_BATCH_HANDLE_LOOKUPS of them per call.
+    Returns one result per input, in order:
+    {'input', 'success', 'channel'} or {'input', 'success', 'error'}
+    """
+    quota_error = "API quota exceeded. Please try again later."
+    results = [{'input': url, 'success': False} for url in channel_urls]
+    
+    # Resolve every input to a channel ID
+    ids_by_index = {}
+    lookups = 0
+    for index, url in enumerate(channel_urls):
+        if not isinstance(url, str) or not url.strip():
+            results[index]['error'] = 'Channel URL must be a non-empty string'
+            continue
+        channel_id, username = parse_channel_input(url.strip())
+        if username:
+            found, channel_id = get_handle_resolution(username, negative_ttl_seconds=HANDLE_NEGATIVE_TTL)
+            if not found:
+                if lookups >= MAX_BATCH_HANDLE_LOOKUPS:
+                    results[index]['error'] = (f'Too many new handles in one request - at most '
+                                               f'{MAX_BATCH_HANDLE_LOOKUPS} are resolved, use channel IDs')
+                    continue
+                lookups += 1
+                try:
+                    channel_id = resolve_username_to_channel_id(username, priority=PRIORITY_BATCH,
+                                                                allow_search=False)
+                except QuotaExceededError:
+                    results[index]['error'] = quota_error
+                    continue
+                except Exception as e:
+                    print(f"Error extracting channel ID: {e}")
+                    channel_id = None
+        if channel_id:
+            ids_by_index[index] = channel_id
+        else:
+            results[index]['error'] = 'Invalid URL or channel not found'
+    
+    # Fetch details for the unique IDs, 50 per call
+    unique_ids = list(dict.fromkeys(ids_by_index.values()))
+    analyses = {}
+    errors = {}
+    for i in range(0, len(unique_ids), 50):
+        batch = unique_ids[i:i+50]
+        try:
+            response = SCHEDULER.execute(
+                'channels',
+                priority=PRIORITY_BATCH,
+                cache='channels',
+                part=ANALYZE_PARTS,
+                id=",".join(batch)
+            )
+        except QuotaExceededError:
+            errors.update((channel_id, quota_error) for channel_id in unique_ids[i:])
+            break
+        except Exception as e:
+            print(f"Error analyzing channels: {e}")
+            errors.update((channel_id, f'Error analyzing channel: {e}') for channel_id in batch)
+            continue
+        for item in response.get('items', []):
+            analyses[item.get('id')] = build_channel_analysis(item)
+    
+    for index, channel_id in ids_by_index.items():
+        if channel_id in analyses:
+            results[index]['success'] = True
+            results[index]['channel'] = copy.deepcopy(analyses[channel_id])
+        elif channel_id in errors:
+            results[index]['error'] = errors[channel_id]
+        else:
+            results[index]['error'] = 'Channel not found'
+    
+    return results
+
+def fetch_new_channels(max_results=100, max_subscribers=100000, target_channels=100, user_id=None, workers=None,
+                       progress_callback=None, should_cancel=None, freshness_hours=None):
     """
     Fetch new YouTube channels, skipping ones already in database
+    Country/keyword pairs are searched concurrently by a pool of `workers`
+    threads (FETCH_WORKERS by default) sharing RATE_LIMITER; new IDs from all
+    pairs are coalesced by ChannelBatcher into full 50-ID detail requests.
+    A search only starts while the new IDs claimed so far plus a page's worth
+    for every search in flight fall short of the target; pairs turned away
+    are searched in a further round if the stored channels still fall short.
+    Every call is charged to SCHEDULER as a batch call: the sweep is refused
+    if today's batch budget can't cover one search, and stops early (with
+    quota_exhausted set) once the budget runs out.
+    progress_callback(progress) is called from the calling thread after each
+    pair with pairs_done, pairs_total, new_channels and skipped; the sweep
+    stops (with cancelled set) as soon as should_cancel() returns True.
+    Each page of a completed search is checkpointed in sweep_checkpoints once
+    the details of every new channel it found have been stored (in page
+    order, up to the first page with channels left unstored), and the next
+    search of the same country/keyword/order resumes from the page token it
+    stopped at (from the first page once a search reaches the last). Pairs are
+    searched least recently searched first, with an order that wasn't used
+    in the last freshness_hours (SWEEP_FRESHNESS_HOURS by default); pairs
+    with no such order left are skipped, so an interrupted sweep resumes
+    where it stopped instead of re-spending quota on the first pairs.
+    Each search follows nextPageToken (up to SEARCH_MAX_PAGES pages) while
+    its pages are at least SEARCH_MIN_NEW_RATIO new channels and the target
+    needs more than the IDs already claimed or reserved.
     Returns: dict with new_channels count, total_fetched, and skipped count
     """
+    # Refuse up front rather than failing partway through the sweep
+    if not SCHEDULER.can_afford(API_COSTS['search'] + API_COSTS['channels'], PRIORITY_BATCH):
+        raise QuotaExceededError("Daily API quota for channel fetching is used up. Please try again tomorrow.")
+    
     # Get already fetched channel IDs
     fetched_ids = get_fetched_channel_ids()
+    existing_count = len(fetched_ids)
+    workers = workers or FETCH_WORKERS
     
     all_new_channels = []
     skipped_count = 0
     total_fetched = 0
     
-    print(f"📊 Already have {len(fetched_ids)} channels in database")
+    print(f"📊 Already have {existing_count} channels in database")
     print(f"🎯 Target: Fetch {target_channels} new channels")
-    print("🚀 Fetching new channels...\n")
+    print(f"🚀 Fetching new channels with {workers} workers...\n")
+    
+    # Use different search strategies to get more diverse channels, skipping
+    # searches done recently and doing the least recently searched pairs first
+    if freshness_hours is None:
+        freshness_hours = SWEEP_FRESHNESS_HOURS
+    fresh_after = (datetime.now(timezone.utc) - timedelta(hours=freshness_hours)).strftime('%Y-%m-%d %H:%M:%S')
+    last_searched = get_sweep_checkpoints()
+    pairs = []
+    for index, (country, keyword) in enumerate((c, k) for c in COUNTRIES for k in KEYWORDS):
+        # Rotate between search orders, starting from a different one each run
+        rotation = [SEARCH_ORDERS[(existing_count + index + i) % len(SEARCH_ORDERS)]
+                    for i in range(len(SEARCH_ORDERS))]
+        searched_at = {order: last_searched.get((country, keyword, order), ('', None))[0] for order in rotation}
+        stale = [order for order in rotation if searched_at[order] < fresh_after]
+        if stale:
+            order = min(stale, key=searched_at.get)
+            resume_token = last_searched.get((country, keyword, order), ('', None))[1]
+            pairs.append((max(searched_at.values()), index, country, keyword, order, resume_token))
+    pairs = [(country, keyword, order, resume_token)
+             for _, _, country, keyword, order, resume_token in sorted(pairs)]
+    pairs_skipped = len(COUNTRIES) * len(KEYWORDS) - len(pairs)
+    if pairs_skipped:
+        print(f"⏭️  Skipping {pairs_skipped} pairs searched in the last {freshness_hours:g} hours")
     
-    # Use different search strategies to get more diverse channels
-    search_orders = ['relevance', 'date', 'viewCount']  # Rotate between strategies
+    # Shared between workers: fetched_ids, claimed and reserved are guarded by
+    # ids_lock, stop ends the sweep
+    ids_lock = threading.Lock()
+    ids_changed = threading.Condition(ids_lock)
+    # New IDs claimed this round, and results reserved by searches in flight,
+    # against what the round needs to reach the target
+    claimed = 0
+    reserved = 0
+    round_need = 0
+    page_yield = min(max_results, SEARCH_PAGE_SIZE)
+    stop = threading.Event()
+    quota_exhausted = threading.Event()
+    cancelled = threading.Event()
+    pairs_done = 0
+    # New IDs from all pairs are coalesced into full 50-ID detail requests
+    batcher = ChannelBatcher()
+    # Pages of finished searches waiting for their channels to be stored: {(country, keyword, order): pages}
+    searched = {}
     
-    for country in COUNTRIES:
-        # Stop if we've reached our target
+    def reserve_page(wait=True):
+        """
+        Reserve a page's worth of results for a search page about to be requested
+        Waits while searches in flight might cover the target (unless wait=False);
+        False once the round's claimed IDs alone cover it (or the sweep stopped)
+        """
+        nonlocal reserved
+        with ids_changed:
+            while not stop.is_set():
+                if claimed + reserved < round_need:
+                    reserved += page_yield
+                    return True
+                if not reserved or not wait:
+                    return False
+                ids_changed.wait(0.5)
+            return False
+    
+    def process_pair(country, keyword, order, resume_token=None):
+        """
+        Search one country/keyword pair and fetch details for any full batches
+        Returns None without searching when the round's claimed IDs already cover the target
+        """
+        nonlocal claimed, reserved
+        if should_cancel and should_cancel():
+            cancelled.set()
+            stop.set()
+        if stop.is_set():
+            return country, keyword, order, [], 0, [], 0, []
+        
+        # Defer the rest of the sweep before the batch budget runs out
+        if not SCHEDULER.can_afford(API_COSTS['search'] + API_COSTS['channels'], PRIORITY_BATCH):
+            quota_exhausted.set()
+            stop.set()
+            return country, keyword, order, [], 0, [], 0, []
+        
+        holding = reserve_page()
+        if not holding:
+            return None if not stop.is_set() else (country, keyword, order, [], 0, [], 0, [])
+        
+        pages = []  # (page_token, next_page_token, new IDs) per page searched
+        data = []
+        fetched = []  # IDs of every batch whose details are in data
+        queued = 0
+        skipped = 0
+        try:
+            for page_token, channel_ids, next_page_token in resume_search_pages(
+                    keyword, country, order, resume_token, max_results=max_results, max_pages=SEARCH_MAX_PAGES):
+                # Claim new IDs so other workers don't fetch details for them again
+                with ids_changed:
+                    new_channel_ids = [cid for cid in channel_ids if cid not in fetched_ids]
+                    fetched_ids.update(new_channel_ids)
+                    claimed += len(new_channel_ids)
+                    if holding:
+                        reserved -= page_yield
+                        holding = False
+                    ids_changed.notify_all()
+                pages.append((page_token, next_page_token, len(new_channel_ids)))
+                queued += len(new_channel_ids)
+                skipped += len(channel_ids) - len(new_channel_ids)
+                
+                for batch in batcher.add(new_channel_ids, keyword, country, order, page_token):
+                    if stop.is_set():
+                        break
+                    data.extend(batcher.fetch(batch, max_subscribers=max_subscribers))
+                    fetched.extend(batch)
+                
+                # Only go a page deeper while pages keep turning up enough new channels
+                if stop.is_set() or not channel_ids or len(new_channel_ids) / len(channel_ids) < SEARCH_MIN_NEW_RATIO:
+                    break
+                if should_cancel and should_cancel():
+                    cancelled.set()
+                    stop.set()
+                    break
+                if not SCHEDULER.can_afford(API_COSTS['search'] + API_COSTS['channels'], PRIORITY_BATCH):
+                    quota_exhausted.set()
+                    stop.set()
+                    break
+                # ...and only while the target still needs more than is already claimed or in flight
+                holding = reserve_page(wait=False)
+                if not holding:
+                    break
+        except QuotaExceededError:
+            quota_exhausted.set()
+            stop.set()
+        finally:
+            if holding:
+                with ids_changed:
+                    reserved -= page_yield
+                    ids_changed.notify_all()
+        return country, keyword, order, pages, queued, data, skipped, fetched
+    
+    def store(data, batch_ids):
+        """
+        Add fetched channels to the database (calling thread only), up to the target
+        Settles the batches' IDs except those of channels cut off by the target
+        """
+        new_count = 0
+        while data and len(all_new_channels) < target_channels:
+            chunk = data[:target_channels - len(all_new_channels)]
+            data = data[len(chunk):]
+            new_ids = set(add_channels(chunk))
+            added = [channel for channel in chunk if channel.get('Channel ID') in new_ids]
+            all_new_channels.extend(added)
+            new_count += len(added)
+        cut_off = {channel.get('Channel ID') for channel in data}
+        batcher.settle([channel_id for channel_id in batch_ids if channel_id not in cut_off])
+        if new_count:
+            print(f"   ✅ Added {new_count} new channels to database")
         if len(all_new_channels) >= target_channels:
-            print(f"\n✅ Reached target of {target_channels} channels!")
-            break
-            
-        for keyword in KEYWORDS:
-            # Stop if we've reached our target
-            if len(all_new_channels) >= target_channels:
-                break
-            print(f"🌎 Country: {country} | Keyword: '{keyword}'")
-            
-            # Strategy: Search channels directly (removed video search to save quota)
-            # Rotate between different search orders for diversity
-            order = search_orders[len(fetched_ids) % len(search_orders)]
-            channel_ids = get_channels(keyword, country, max_results=max_results, order=order)
-            
-            # Use only channel search (removed video search to optimize quota usage)
-            all_channel_ids = channel_ids
-            
-            # Filter out already fetched channels
-            new_channel_ids = [cid for cid in all_channel_ids if cid not in fetched_ids]
-            skipped = len(all_channel_ids) - len(new_channel_ids)
-            skipped_count += skipped
-            
-            if skipped > 0:
-                print(f"   ⏭️  Skipped {skipped} already-fetched channels")
-            
-            if not new_channel_ids:
-                print(f"   ℹ️  No new channels found")
-                continue
+            if new_count:
+                print(f"\n✅ Reached target of {target_channels} channels!")
+            stop.set()
+        return new_count
+    
+    def checkpoint_settled():
+        """
+        Checkpoint the pages of finished searches whose new channels have all been stored
+        Pages are saved in order and stop at the first with channels left, so the
+        search resumes from that page
+        """
+        for search, pages in list(searched.items()):
+            while pages and not batcher.unsettled(*search, pages[0][0]):
+                page_token, next_page_token, page_new = pages.pop(0)
+                save_sweep_checkpoint(*search, page_token, next_page_token, page_new)
+            if not pages:
+                del searched[search]
+    
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fetch')
+    try:
+        round_pairs = pairs
+        while round_pairs and not stop.is_set():
+            if round_pairs is not pairs:
+                print(f"\n🔁 {target_channels - len(all_new_channels)} channels short of the target - "
+                      f"searching up to {len(round_pairs)} more pairs")
+            with ids_lock:
+                claimed = 0
+                reserved = 0
+                round_need = target_channels - len(all_new_channels)
+            futures = {executor.submit(process_pair, *pair): pair for pair in round_pairs}
+            round_pairs = []
             
-            print(f"   ➤ Fetching details for {len(new_channel_ids)} new channels...")
-            data = get_channel_details(new_channel_ids, max_subscribers=max_subscribers)
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                result = future.result()
+                if result is None:
+                    # Searches already claimed enough IDs - retry if their channels fall short
+                    round_pairs.append(futures[future])
+                    continue
+                country, keyword, order, pages, queued, data, skipped, fetched = result
+                skipped_count += skipped
+                pairs_done += 1
+                if pages:
+                    searched[(country, keyword, order)] = pages
             
-            # Add metadata
-            for d in data:
-                d["Search Keyword"] = keyword
-                d["Country Code"] = country
+                if should_cancel and should_cancel():
+                    cancelled.set()
+                    stop.set()
+                if stop.is_set():
+                    for pending in futures:
+                        pending.cancel()
+                    # Details already fetched are kept (up to the target) so their searches can be checkpointed
+                    total_fetched += store(data, fetched)
+                    checkpoint_settled()
+                    continue
             
-            # Add to database
-            new_count = 0
-            for channel in data:
-                if add_channel(channel):
-                    all_new_channels.append(channel)
-                    new_count += 1
-                    total_fetched += 1
-                    # Update fetched_ids to avoid duplicates in same run
-                    fetched_ids.add(channel.get('Channel ID'))
+                print(f"🌎 Country: {country} | Keyword: '{keyword}'")
+                if skipped > 0:
+                    print(f"   ⏭️  Skipped {skipped} already-fetched channels")
+                if len(pages) > 1:
+                    print(f"   📄 Searched {len(pages)} result pages")
+                if queued:
+                    print(f"   ➤ Queued {queued} new channels for detail lookup")
+                else:
+                    print(f"   ℹ️  No new channels found")
             
-            print(f"   ✅ Added {new_count} new channels to database")
-            time.sleep(1)  # Rate limiting
+                total_fetched += store(data, fetched)
+                checkpoint_settled()
+                if progress_callback:
+                    progress_callback({
+                        'pairs_done': pairs_done,
+                        'pairs_total': len(pairs),
+                        'pairs_skipped': pairs_skipped,
+                        'new_channels': len(all_new_channels),
+                        'skipped': skipped_count
+                    })
+                if quota_exhausted.is_set():
+                    print("\n⚠️  Daily API quota for fetching is used up - stopping sweep")
+                if stop.is_set():
+                    for pending in futures:
+                        pending.cancel()
+        
+            # Fetch whatever is left in the last partial batch
+            # (even after a quota stop - detail calls only cost 1 unit each)
+            for batch in batcher.drain():
+                if len(all_new_channels) >= target_channels or cancelled.is_set():
+                    break
+                print(f"   ➤ Fetching details for the remaining {len(batch)} channels...")
+                try:
+                    total_fetched += store(batcher.fetch(batch, max_subscribers=max_subscribers), batch)
+                except QuotaExceededError:
+                    quota_exhausted.set()
+                    break
+            checkpoint_settled()
+    except Exception:
+        stop.set()
+        raise
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
     
     print(f"\n✅ Done! Added {len(all_new_channels)} new channels")
-    print(f"📊 Total in database: {len(fetched_ids) + len(all_new_channels)}")
+    print(f"📊 Total in database: {existing_count + len(all_new_channels)}")
     print(f"⏭️  Skipped: {skipped_count} already-fetched channels")
     if len(all_new_channels) >= target_channels:
         print(f"🎯 Successfully reached target of {target_channels} channels!")
@@ -413,7 +1162,10 @@ def fetch_new_channels(max_results=100, max_subscribers=100000, target_channels=
         'new_channels': len(all_new_channels),
         'total_fetched': total_fetched,
         'skipped': skipped_count,
-        'target_reached': len(all_new_channels) >= target_channels
+        'target_reached': len(all_new_channels) >= target_channels,
+        'quota_exhausted': quota_exhausted.is_set(),
+        'cancelled': cancelled.is_set(),
+        'pairs_skipped': pairs_skipped
     }
 
 if __name__ == "__main__":